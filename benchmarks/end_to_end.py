@@ -0,0 +1,240 @@
+"""
+Offline end-to-end benchmark: ingest a synthetic corpus through process_new_pdf, then query it,
+with ChatOpenAI, OpenAIEmbeddings and (unless --pdf is given) partition_pdf replaced by the
+deterministic fakes in benchmarks.fakes. Everything runs in a scratch directory, so the app's own stores are untouched.
+
+Prints a JSON report (ingest throughput, query latency percentiles, docstore load time, peak RSS) to stdout,
+or writes it to --output; app logging goes to stderr. Reports of two commits can be diffed directly.
+
+    python -m benchmarks.end_to_end --documents 20 --pages 8 --queries 100 --output before.json
+    python -m benchmarks.end_to_end --pdf src/uploads/0001.pdf --queries 20    # real partitioning
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(values):
+    """Latency summary in milliseconds, nearest-rank percentiles"""
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2)
+
+    return {"mean_ms": round(sum(values) / len(values) * 1000, 2), "p50_ms": at(0.5), "p95_ms": at(0.95),
+            "p99_ms": at(0.99), "max_ms": round(values[-1] * 1000, 2)}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def ingest_all(ingest, documents, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(fpath, fname):
+        async with semaphore:
+            await ingest.process_new_pdf(fpath, fname)
+
+    await asyncio.gather(*(one(fpath, fname) for fpath, fname in documents))
+
+
+async def run_queries(app, queries, concurrency, stream):
+    """Latencies of every query, plus the time to the first answer token when streaming"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, first_tokens = [], []
+
+    async def one(query):
+        async with semaphore:
+            start_time = time.perf_counter()
+            if stream:
+                first_token = None
+                async for event, _ in app.stream_query_vectorstore(query):
+                    if event == "token" and first_token is None:
+                        first_token = time.perf_counter() - start_time
+                if first_token is not None:
+                    first_tokens.append(first_token)
+            else:
+                await app.query_vectorstore(query)
+            latencies.append(time.perf_counter() - start_time)
+
+    await asyncio.gather(*(one(query) for query in queries))
+    return latencies, first_tokens
+
+
+def run(args):
+    from benchmarks import fakes
+    fakes.settings.update(
+        llm_latency=args.llm_latency, token_delay=args.token_delay, embedding_latency=args.embedding_latency
+    )
+    tokenizer = fakes.install()
+
+    from src import ingest, main as app
+    from src.config import Config
+    from src.vector_store.retriever_service import RetrieverService
+
+    rng = np.random.default_rng(args.seed)
+    if args.pdf:
+        documents = [(os.path.dirname(os.path.abspath(path)) + "/", os.path.basename(path)) for path in args.pdf]
+    else:
+        corpus = {
+            f"{i + 1:04d}.pdf": fakes.synthetic_document(
+                f"{i + 1:04d}.pdf", args.seed + i, args.pages, args.paragraphs, args.images, args.table_every
+            )
+            for i in range(args.documents)
+        }
+
+        def synthetic_batches(fpath, fname):
+            # Page ranges of the size the real partitioner would use, each taking --partition-latency per page
+            elements = corpus[fname]
+            per_batch = Config.PARTITION_PAGES_PER_TASK
+            for first_page in range(1, args.pages + 1, per_batch):
+                time.sleep(args.partition_latency * min(per_batch, args.pages + 1 - first_page))
+                yield [element for element in elements if first_page <= element.metadata.page_number < first_page + per_batch]
+
+        ingest.iter_pdf_element_batches = synthetic_batches
+        documents = [("src/uploads/", fname) for fname in corpus]
+
+    # Counts whatever the partitioner yields, fake or real
+    partitioned = {"elements": 0, "pages": 0}
+    partition = ingest.iter_pdf_element_batches
+
+    def counted_batches(fpath, fname):
+        pages = set()
+        for elements in partition(fpath, fname):
+            partitioned["elements"] += len(elements)
+            pages.update(element.metadata.page_number for element in elements)
+            yield elements
+        partitioned["pages"] += len(pages)
+
+    ingest.iter_pdf_element_batches = counted_batches
+
+    start_time = time.perf_counter()
+    asyncio.run(ingest_all(ingest, documents, args.ingest_concurrency))
+    ingest_seconds = time.perf_counter() - start_time
+    llm_calls = dict(fakes.counters)
+
+    start_time = time.perf_counter()
+    service = RetrieverService(
+        Config.vectorstore, Config.DOCSTORE_PATH, Config.LEGACY_DOCSTORE_PATH, Config.image_store, Config.INDEX_LOCK_PATH
+    )
+    service.load()
+    load_seconds = time.perf_counter() - start_time
+    keys = list(service.docstore.yield_keys())
+    start_time = time.perf_counter()
+    service.docstore.mget(keys)
+    read_all_seconds = time.perf_counter() - start_time
+
+    queries = [fakes.synthetic_query(rng) for _ in range(args.queries)]
+    start_time = time.perf_counter()
+    latencies, first_tokens = asyncio.run(run_queries(app, queries, args.query_concurrency, args.stream))
+    query_seconds = time.perf_counter() - start_time
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "workdir", "keep")},
+        "tokenizer": tokenizer,
+        "ingest": {
+            "documents": len(documents),
+            "pages": partitioned["pages"],
+            "elements": partitioned["elements"],
+            "seconds": round(ingest_seconds, 3),
+            "documents_per_second": round(len(documents) / ingest_seconds, 3),
+            "pages_per_second": round(partitioned["pages"] / ingest_seconds, 3),
+            "elements_per_second": round(partitioned["elements"] / ingest_seconds, 3),
+            "llm_calls": llm_calls["chat"],
+            "embedding_requests": llm_calls["embedding_requests"],
+            "embedded_texts": llm_calls["embedded_texts"],
+        },
+        "docstore": {
+            "entries": len(keys),
+            "load_seconds": round(load_seconds, 4),
+            "read_all_seconds": round(read_all_seconds, 4),
+        },
+        "query": {
+            "count": len(latencies),
+            "concurrency": args.query_concurrency,
+            "queries_per_second": round(len(latencies) / query_seconds, 3) if latencies else None,
+            **percentiles(latencies),
+            "llm_calls": fakes.counters["chat"] - llm_calls["chat"],
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if args.stream:
+        report["query"]["first_token"] = percentiles(first_tokens)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=4, help="Pages per synthetic document")
+    parser.add_argument("--paragraphs", type=int, default=3, help="Paragraphs per page")
+    parser.add_argument("--images", type=int, default=1, help="Images per page")
+    parser.add_argument("--table-every", type=int, default=2, help="One table every this many pages, 0 for none")
+    parser.add_argument("--pdf", nargs="+", help="Ingest these PDFs with the real partitioner instead of a synthetic corpus")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--stream", action="store_true", help="Query through the streaming path and report time to first token")
+    parser.add_argument("--ingest-concurrency", type=int, default=2)
+    parser.add_argument("--query-concurrency", type=int, default=1)
+    parser.add_argument("--partition-latency", type=float, default=0.0, help="Seconds per page of the fake partitioner")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per chat call, before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds per further streamed token")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="Seconds per embedding request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Scratch directory for the stores; a temporary one by default")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag-benchmark-"))
+    os.makedirs(os.path.join(workdir, "src", "uploads"), exist_ok=True)
+    output = os.path.abspath(args.output) if args.output else None
+    args.pdf = [os.path.abspath(path) for path in args.pdf] if args.pdf else None
+
+    # The app's store paths are relative, so they resolve inside the scratch directory
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    # The fakes never rate limit, so the scheduler's per-minute budgets would only add waits of their own
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000000")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000000")
+
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run(args)
+    finally:
+        os.chdir(REPO_ROOT)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
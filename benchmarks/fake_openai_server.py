@@ -0,0 +1,119 @@
+"""
+Minimal OpenAI-compatible server for exercising the app without spending API credits.
+
+Chat completions echo a canned answer after a configurable latency (streamed word by word
+when the client asks for a stream) and can reject a share of requests with 429 to exercise the scheduler's retries. Embeddings are deterministic
+pseudo-random unit vectors derived from the text.
+
+    python -m benchmarks.fake_openai_server --port 9000 --latency 0.5 --rate-limit-ratio 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=fake uvicorn src.api:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+settings = {"latency": 0.2, "token_delay": 0.02, "rate_limit_ratio": 0.0, "dimensions": 1536}
+counters = {"chat": 0, "embeddings": 0, "rate_limited": 0}
+
+
+def fake_embedding(text, dimensions):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+async def stream_chunks(body, answer):
+    """The latency applies before the first chunk, every further word then takes token_delay"""
+    await asyncio.sleep(settings["latency"])
+    for i, word in enumerate(answer.split(" ")):
+        if i:
+            await asyncio.sleep(settings["token_delay"])
+        chunk = {
+            "id": f"chatcmpl-{counters['chat']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    if (body.get("stream_options") or {}).get("include_usage"):
+        # As OpenAI does, a last chunk without choices reports the usage
+        chunk = {
+            "id": f"chatcmpl-{counters['chat']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [],
+            "usage": {"prompt_tokens": 100, "completion_tokens": len(answer.split(" ")), "total_tokens": 100 + len(answer.split(" "))},
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if random.random() < settings["rate_limit_ratio"]:
+        counters["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": "0.1"},
+            content={"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+        )
+    counters["chat"] += 1
+    answer = f"Fake answer from {body.get('model')} for {len(body.get('messages', []))} message(s)."
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(body, answer), media_type="text/event-stream")
+    await asyncio.sleep(settings["latency"])
+    return {
+        "id": f"chatcmpl-{counters['chat']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    counters["embeddings"] += 1
+    # Token arrays are sent when the client tokenizes locally
+    texts = [text if isinstance(text, str) else " ".join(map(str, text)) for text in inputs]
+    return {
+        "object": "list",
+        "model": body.get("model"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, settings["dimensions"])}
+            for i, text in enumerate(texts)
+        ],
+        "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)},
+    }
+
+
+@app.get("/counters")
+async def get_counters():
+    return counters
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    args = parser.parse_args()
+    settings["latency"] = args.latency
+    settings["token_delay"] = args.token_delay
+    settings["rate_limit_ratio"] = args.rate_limit_ratio
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
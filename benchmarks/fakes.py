@@ -0,0 +1,273 @@
+"""
+Deterministic in-process stand-ins for ChatOpenAI, OpenAIEmbeddings and partition_pdf, for benchmarks that
+must run offline and without spending API credits.
+
+install() has to run before anything under src is imported, since the app binds the OpenAI classes at import time.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import re
+import time
+from typing import Optional
+import numpy as np
+from PIL import Image
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+settings = {"llm_latency": 0.05, "token_delay": 0.0, "answer_words": 60, "embedding_latency": 0.01, "dimensions": 1536}
+counters = {"chat": 0, "chat_tokens": 0, "embedding_requests": 0, "embedded_texts": 0}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+VOCABULARY = (
+    "llama model benchmark table revenue growth figure human eval score accuracy latency token context chart "
+    "multiple median valuation period quarter forecast dataset training parameter inference throughput memory "
+    "release announcement safety vision audio reasoning coding math retrieval ranking index cost budget"
+).split()
+
+
+def _message_text(messages):
+    parts = []
+    for message in messages:
+        content = message.content
+        for part in content if isinstance(content, list) else [content]:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                # Tells images apart, so each one gets its own summary
+                parts.append("image " + hashlib.sha1(part["image_url"]["url"].encode("utf-8")).hexdigest()[:12])
+            elif isinstance(part, dict):
+                parts.append(part.get("text", ""))
+            else:
+                parts.append(str(part))
+    return " ".join(parts)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Accepts the ChatOpenAI arguments the app passes and answers after settings["llm_latency"].
+    The answer repeats the last words of the prompt, so summaries stay specific to the element they summarize.
+    """
+
+    model: str = "fake"
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    max_retries: int = 0
+    base_url: Optional[str] = None
+    openai_api_key: Optional[str] = None
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _reply(self, messages):
+        prompt = _message_text(messages)
+        words = WORD_PATTERN.findall(prompt.lower())[-settings["answer_words"]:] or ["empty"]
+        prompt_tokens = len(prompt) // 4
+        counters["chat"] += 1
+        counters["chat_tokens"] += prompt_tokens + len(words)
+        usage = {"input_tokens": prompt_tokens, "output_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+        return words, usage
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(settings["llm_latency"])
+        words, usage = self._reply(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words), usage_metadata=usage))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(settings["llm_latency"])
+        words, usage = self._reply(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words), usage_metadata=usage))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        """The latency applies before the first chunk, every further word then takes settings["token_delay"]"""
+        await asyncio.sleep(settings["llm_latency"])
+        words, usage = self._reply(messages)
+        for i, word in enumerate(words):
+            if i and settings["token_delay"]:
+                await asyncio.sleep(settings["token_delay"])
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+        # Like ChatOpenAI with stream_usage, the last chunk carries the usage
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words unit vectors, so texts sharing words get similar embeddings and retrieval behaves plausibly.
+    Every request takes settings["embedding_latency"], whatever its size, like one batched API call.
+    """
+
+    model = "fake-embedding"
+
+    def __init__(self, **kwargs):
+        pass
+
+    def _embed(self, texts):
+        counters["embedding_requests"] += 1
+        counters["embedded_texts"] += len(texts)
+        dimensions = settings["dimensions"]
+        vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in WORD_PATTERN.findall(text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, digest % dimensions] += 1.0 if digest >> 63 else -1.0
+            norm = np.linalg.norm(vectors[row])
+            if norm:
+                vectors[row] /= norm
+            else:
+                vectors[row, 0] = 1.0
+        return vectors.tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(settings["embedding_latency"])
+        return self._embed(texts)
+
+    def embed_query(self, text):
+        time.sleep(settings["embedding_latency"])
+        return self._embed([text])[0]
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(settings["embedding_latency"])
+        return self._embed(texts)
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(settings["embedding_latency"])
+        return self._embed([text])[0]
+
+
+class RegexEncoding:
+    """Word-level stand-in for a tiktoken encoding, for when the encoding files cannot be downloaded"""
+
+    def encode(self, text, disallowed_special=()):
+        return re.findall(r"\S+\s*", text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def install():
+    """Swap the OpenAI classes for the fakes; returns the tokenizer context packing will use"""
+    import langchain_openai
+    langchain_openai.ChatOpenAI = FakeChatModel
+    langchain_openai.OpenAIEmbeddings = FakeEmbeddings
+
+    from src.rag import context_packer
+    try:
+        context_packer.get_encoding()
+        return "tiktoken"
+    except Exception:
+        context_packer._encodings["gpt-4o-mini"] = RegexEncoding()
+        return "regex"
+
+
+# Synthetic partition_pdf output. The app recognises element kinds by the module path in their type name,
+# so the classes below report the module of the unstructured element types they imitate.
+
+class _Coordinates:
+    def __init__(self, points, layout_width, layout_height):
+        self.points = points
+        self.layout_width = layout_width
+        self.layout_height = layout_height
+
+    def to_dict(self):
+        return {"points": self.points, "layout_width": self.layout_width, "layout_height": self.layout_height}
+
+
+class _Metadata:
+    def __init__(self, filename, page_number, coordinates, orig_elements=None, image_base64=None):
+        self.filename = filename
+        self.page_number = page_number
+        self.coordinates = coordinates
+        self.orig_elements = orig_elements or []
+        self.image_base64 = image_base64
+
+    def to_dict(self):
+        data = {"filename": self.filename, "page_number": self.page_number, "coordinates": self.coordinates.to_dict()}
+        if self.image_base64:
+            data["image_base64"] = self.image_base64
+        return data
+
+
+class _Element:
+    __module__ = "unstructured.documents.elements"
+
+    def __init__(self, element_id, text, metadata):
+        self.id = element_id
+        self.text = text
+        self.metadata = metadata
+
+    def __str__(self):
+        return self.text
+
+
+class CompositeElement(_Element):
+    __module__ = "unstructured.documents.elements"
+
+
+class Table(_Element):
+    __module__ = "unstructured.documents.elements"
+
+
+class NarrativeText(_Element):
+    __module__ = "unstructured.documents.elements"
+
+
+# Named so it matches the "Image" check without matching the "Table" one
+class Image_(_Element):
+    __module__ = "unstructured.documents.elements"
+    __qualname__ = "Image"
+
+
+LAYOUT_WIDTH, LAYOUT_HEIGHT = 1700, 2200
+
+
+def _box(rng):
+    x1, y1 = int(rng.integers(0, LAYOUT_WIDTH // 2)), int(rng.integers(0, LAYOUT_HEIGHT // 2))
+    x2, y2 = x1 + int(rng.integers(100, LAYOUT_WIDTH // 2)), y1 + int(rng.integers(50, LAYOUT_HEIGHT // 4))
+    return _Coordinates(((x1, y1), (x1, y2), (x2, y2), (x2, y1)), LAYOUT_WIDTH, LAYOUT_HEIGHT)
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(VOCABULARY, size=words)) + "."
+
+
+def _png(rng, size=(160, 120)):
+    # Noise compresses badly, so every image clears the app's 3 KB minimum
+    pixels = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def synthetic_document(fname, seed, pages=4, paragraphs_per_page=3, images_per_page=1, table_every=2):
+    """partition_pdf-shaped elements for one document: a composite chunk per page, with images, and a table every table_every pages"""
+    rng = np.random.default_rng(seed)
+    elements = []
+
+    def element_id(*parts):
+        return hashlib.sha1("-".join([fname, *map(str, parts)]).encode("utf-8")).hexdigest()[:32]
+
+    for page in range(1, pages + 1):
+        orig = [
+            NarrativeText(element_id(page, "text", i), " ".join(_sentence(rng, 12) for _ in range(8)),
+                          _Metadata(fname, page, _box(rng)))
+            for i in range(paragraphs_per_page)
+        ]
+        for i in range(images_per_page):
+            payload = base64.b64encode(_png(rng)).decode("ascii")
+            orig.append(Image_(element_id(page, "image", i), "", _Metadata(fname, page, _box(rng), image_base64=payload)))
+        text = "\n\n".join(str(element) for element in orig if element.text)
+        elements.append(CompositeElement(element_id(page, "composite"), text, _Metadata(fname, page, _box(rng), orig)))
+
+        if table_every and page % table_every == 0:
+            rows = [" | ".join(rng.choice(VOCABULARY, size=4)) + f" | {rng.integers(0, 1000)}" for _ in range(8)]
+            text = "\n".join(rows)
+            cell = Table(element_id(page, "table-cell"), text, _Metadata(fname, page, _box(rng)))
+            elements.append(Table(element_id(page, "table"), text, _Metadata(fname, page, _box(rng), [cell])))
+    return elements
+
+
+def synthetic_query(rng, words=6):
+    return "What does the document say about " + " ".join(rng.choice(VOCABULARY, size=words)) + "?"
@@ -0,0 +1,73 @@
+"""
+Cold import time of the API and the modules under it, each in a fresh interpreter, with the
+slowest imports each one pulls in (from python -X importtime).
+
+    python -m benchmarks.import_time --runs 5
+    QUERY_ONLY=true python -m benchmarks.import_time src.api
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["src.config", "src.rag.rag_chain", "src.main", "src.api"]
+
+
+def timed_import(module):
+    """Wall-clock seconds of a fresh interpreter importing module, and its (cumulative_us, name) import entries"""
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    start_time = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start_time
+    if completed.returncode != 0:
+        return None, completed.stderr.strip().splitlines()[-1]
+    entries = []
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                # Nesting is shown by two spaces of indentation per level, after one space of padding
+                entries.append((int(cumulative), name[1:].rstrip()))
+    return elapsed, entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="Slowest top-level third-party imports to list per module")
+    args = parser.parse_args()
+
+    print(f"QUERY_ONLY={os.getenv('QUERY_ONLY', 'false')}")
+    for module in args.modules:
+        timings, entries = [], []
+        for _ in range(args.runs):
+            elapsed, result = timed_import(module)
+            if elapsed is None:
+                break
+            timings.append(elapsed)
+            entries = result
+        if not timings:
+            print(f"{module:<20} failed: {result}")
+            continue
+        print(f"{module:<20} median {statistics.median(timings) * 1000:8.0f} ms  min {min(timings) * 1000:8.0f} ms")
+        # Third-party packages imported by the app's own modules, slowest first
+        heaviest = {}
+        parents = []
+        for cumulative, name in reversed(entries):
+            depth = (len(name) - len(name.lstrip())) // 2
+            name = name.strip()
+            del parents[depth:]
+            parents.append(name)
+            if depth and parents[depth - 1].startswith("src") and not name.startswith("src"):
+                heaviest[name] = max(heaviest.get(name, 0), cumulative)
+        heaviest = sorted(((cumulative, name) for name, cumulative in heaviest.items()), reverse=True)[:args.top]
+        for cumulative, name in heaviest:
+            print(f"    {name:<40} {cumulative / 1000:8.0f} ms")
@@ -0,0 +1,64 @@
+"""
+Wall-clock time of iter_pdf_element_batches, the page-range pipeline ingest partitions with,
+against page count, in-process versus page-parallel.
+Reports when the first batch of chunks is ready, which is when summarizing can start, and when the last one is.
+
+Each worker pool first partitions a warm-up PDF so model loading is not counted.
+
+    python -m benchmarks.partition_speedup src/uploads/0001.pdf --pages 4 8 16 --workers 1 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from src.pdf_processing.pdf_processing import iter_pdf_element_batches
+
+
+def truncated_pdf(pdf_path, pages, output_dir):
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(pdf_path)
+    writer = PdfWriter()
+    for page in reader.pages[:pages]:
+        writer.add_page(page)
+    fname = f"first-{pages}.pdf"
+    with open(os.path.join(output_dir, fname), "wb") as f:
+        writer.write(f)
+    return min(pages, len(reader.pages)), fname
+
+
+def timed_batches(path, fname, workers, pages_per_task):
+    """Seconds until the first batch, seconds until the last, and the number of chunks"""
+    start_time = time.perf_counter()
+    first = None
+    chunks = 0
+    for batch in iter_pdf_element_batches(path, fname, workers=workers, pages_per_task=pages_per_task):
+        first = first or time.perf_counter() - start_time
+        chunks += len(batch)
+    return first or 0.0, time.perf_counter() - start_time, chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--pages-per-task", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = tmp_dir + "/"
+        # Enough pages to give every worker of the largest pool a task
+        _, warmup = truncated_pdf(args.pdf, max(args.workers) * args.pages_per_task, tmp_dir)
+        for workers in args.workers:
+            timed_batches(path, warmup, workers, args.pages_per_task)
+
+        for pages in args.pages:
+            page_count, fname = truncated_pdf(args.pdf, pages, tmp_dir)
+            baseline = None
+            for workers in args.workers:
+                first, seconds, chunks = timed_batches(path, fname, workers, args.pages_per_task)
+                baseline = baseline or seconds
+                print(
+                    f"pages={page_count:<4} workers={workers:<3} first batch {first:8.2f} s  all {seconds:8.2f} s  "
+                    f"chunks={chunks:<4} speedup {baseline / seconds:5.2f}x"
+                )
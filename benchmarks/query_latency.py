@@ -0,0 +1,96 @@
+"""
+Per-query retrieval latency of the old /query/ path, which unpickled the docstore and rebuilt the retriever
+and chain on every call, against the resident RetrieverService, which refreshes the corpus version and reads
+the SQLite docstore. Both run retrieve_sources on copies of ./chroma_store and ./docstore.pkl in a scratch
+directory, with the fake embeddings from benchmarks.fakes, so no OpenAI calls are made and the app's stores are untouched.
+
+    python -m benchmarks.query_latency --iterations 50
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def measure(fn, queries):
+    timings = []
+    for query in queries:
+        start_time = time.perf_counter()
+        await fn(query)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<14} mean {statistics.mean(timings):8.2f} ms  p50 {statistics.median(timings):8.2f} ms  p95 {p95:8.2f} ms")
+
+
+async def run(args):
+    from langchain.retrievers.multi_vector import MultiVectorRetriever
+    from src.config import Config
+    from src.rag.rag_chain import multi_modal_rag_chain_with_reranking, retrieve_sources
+    from src.vector_store.docstore import load_in_memory_store
+    from src.vector_store.retriever_service import get_retriever_service
+
+    async def per_request(query):
+        docstore = load_in_memory_store(Config.LEGACY_DOCSTORE_PATH)
+        retriever = MultiVectorRetriever(vectorstore=Config.vectorstore, docstore=docstore, id_key="doc_id")
+        multi_modal_rag_chain_with_reranking(retriever)
+        return await retrieve_sources(retriever, query)
+
+    service = get_retriever_service()
+
+    async def resident(query):
+        await asyncio.to_thread(service.corpus_version)
+        return await retrieve_sources(service.retriever, query)
+
+    # Summaries of docstore entries make plausible queries; ./chroma_store also holds summaries without one
+    doc_ids = list(load_in_memory_store(Config.LEGACY_DOCSTORE_PATH).store)
+    summaries = Config.vectorstore.get(where={"doc_id": {"$in": doc_ids}}, limit=args.iterations, include=["documents"])["documents"]
+    queries = [" ".join(summary.split()[:12]) for summary in summaries]
+    queries = (queries * (args.iterations // max(len(queries), 1) + 1))[:args.iterations]
+
+    # Opening Chroma, and migrating the pickle into the SQLite docstore, are one-off costs kept out of the timings
+    with contextlib.redirect_stdout(sys.stderr):
+        await asyncio.to_thread(service.load)
+        await per_request(queries[0])
+        await resident(queries[0])
+    report("per-request", await measure(per_request, queries))
+    report("resident", await measure(resident, queries))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    pickle_path = os.path.join(REPO_ROOT, "docstore.pkl")
+    print(f"Legacy docstore: {pickle_path} ({os.path.getsize(pickle_path) / (1024 * 1024):.1f} MB)")
+
+    workdir = tempfile.mkdtemp(prefix="rag-query-latency-")
+    shutil.copytree(os.path.join(REPO_ROOT, "chroma_store"), os.path.join(workdir, "chroma_store"))
+    shutil.copy(pickle_path, workdir)
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # The old path had no BM25 index to search
+    os.environ.setdefault("HYBRID_RETRIEVAL", "false")
+    try:
+        # The fakes replace the OpenAI classes before anything under src is imported
+        from benchmarks import fakes
+        fakes.settings.update(embedding_latency=0.0)
+        fakes.install()
+        asyncio.run(run(args))
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
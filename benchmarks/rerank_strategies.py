@@ -0,0 +1,78 @@
+"""
+Per-query cost of each reranking strategy on synthetic candidates.
+
+The embedding reranker reads vectors from an in-memory stand-in for Chroma, so only
+the scoring itself is timed. The cross-encoder downloads its model on first use.
+
+    python -m benchmarks.rerank_strategies --candidates 4 20 100 --cross-encoder
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+from src.rag.rerank import EmbeddingReranker, TfidfReranker, CrossEncoderReranker
+
+WORDS = "llama model benchmark table revenue growth figure human eval score accuracy latency token context chart".split()
+
+
+class InMemoryVectors:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def get(self, where, include):
+        doc_ids = where["doc_id"]["$in"]
+        return {
+            "metadatas": [{"doc_id": doc_id} for doc_id in doc_ids],
+            "embeddings": [self.vectors[doc_id] for doc_id in doc_ids],
+        }
+
+
+def synthetic_candidates(n, dim, rng):
+    sources = []
+    texts = []
+    vectors = {}
+    for i in range(n):
+        doc_id = f"doc-{i}"
+        text = " ".join(rng.choice(WORDS) for _ in range(400))
+        sources.append({"doc_id": doc_id, "content": text, "metadata": {}})
+        texts.append(text)
+        vectors[doc_id] = np.random.default_rng(i).standard_normal(dim).astype(np.float32).tolist()
+    return sources, texts, vectors
+
+
+def measure(reranker, query, query_embedding, sources, texts, iterations):
+    timings = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        reranker.score(query, query_embedding, sources, texts)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, nargs="+", default=[4, 20, 100])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--cross-encoder", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    query = "How does llama compare on human eval benchmark scores?"
+    query_embedding = np.random.default_rng(12345).standard_normal(args.dim).astype(np.float32).tolist()
+    cross_encoder = CrossEncoderReranker() if args.cross_encoder else None
+
+    for n in args.candidates:
+        sources, texts, vectors = synthetic_candidates(n, args.dim, rng)
+        results = {
+            "embedding": measure(EmbeddingReranker(InMemoryVectors(vectors)), query, query_embedding, sources, texts, args.iterations),
+            "tfidf": measure(TfidfReranker(), query, query_embedding, sources, texts, args.iterations),
+        }
+        if cross_encoder is not None:
+            results["cross_encoder"] = measure(cross_encoder, query, query_embedding, sources, texts, max(1, args.iterations // 10))
+        print(f"candidates={n:<4} " + "  ".join(f"{name} {ms:8.3f} ms" for name, ms in results.items()))
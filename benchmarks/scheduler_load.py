@@ -0,0 +1,55 @@
+"""
+Drive the shared LLM scheduler with a burst of background calls and a trickle of
+interactive calls against the fake OpenAI server, and report latency per priority.
+
+    python -m benchmarks.fake_openai_server --port 9000 --rate-limit-ratio 0.1 &
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 python -m benchmarks.scheduler_load --background 300 --interactive 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+from langchain_core.messages import HumanMessage
+from src.llm.scheduler import LLMScheduler, get_chat_model, INTERACTIVE, BACKGROUND
+
+
+async def timed_call(scheduler, model, priority, latencies):
+    start_time = time.perf_counter()
+    await scheduler.ainvoke(model, [HumanMessage(content="Summarize this table: | a | b |")], priority=priority)
+    latencies[priority].append(time.perf_counter() - start_time)
+
+
+async def main(args):
+    scheduler = LLMScheduler(rpm=args.rpm, tpm=args.tpm, max_concurrency=args.concurrency, max_retries=6, base_delay=0.1)
+    model = get_chat_model("gpt-4o-mini", max_tokens=64)
+    latencies = {INTERACTIVE: [], BACKGROUND: []}
+
+    start_time = time.perf_counter()
+    background = [asyncio.create_task(timed_call(scheduler, model, BACKGROUND, latencies)) for _ in range(args.background)]
+    interactive = []
+    for _ in range(args.interactive):
+        await asyncio.sleep(args.interactive_interval)
+        interactive.append(asyncio.create_task(timed_call(scheduler, model, INTERACTIVE, latencies)))
+    await asyncio.gather(*background, *interactive)
+
+    print(f"total {time.perf_counter() - start_time:.2f} s, retries {scheduler.retries}")
+    for priority, name in ((INTERACTIVE, "interactive"), (BACKGROUND, "background")):
+        values = sorted(latencies[priority])
+        if values:
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            print(f"{name:<12} n={len(values):<5} p50 {statistics.median(values):6.2f} s  p95 {p95:6.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--background", type=int, default=200)
+    parser.add_argument("--interactive", type=int, default=20)
+    parser.add_argument("--interactive-interval", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--tpm", type=int, default=200000)
+    asyncio.run(main(parser.parse_args()))
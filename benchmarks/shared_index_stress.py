@@ -0,0 +1,319 @@
+"""
+Multi-process stress test of the shared index: writer processes commit batches of entries (and periodically
+delete and re-index their document) while reader processes query the same stores, as uvicorn workers would.
+The OpenAI classes are replaced by the fakes in benchmarks.fakes, and everything runs in a scratch directory.
+
+Checks, reported in the JSON output, and the exit status is 1 if any fails:
+- atomic commits: readers never see part of a batch (every document's visible entry count is a multiple of the batch size)
+- freshness: every reader finds every committed batch through vector search, without reloading; the lag is reported
+- no lost writes: afterwards the docstore, Chroma and the BM25 index all hold exactly the surviving entries,
+  no entry is left pending, and a fresh process finds every surviving batch
+- job claims: processes racing to claim ingest jobs claim each one exactly once
+
+    python -m benchmarks.shared_index_stress --writers 3 --readers 4 --batches 40
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def enter_workdir(workdir):
+    """Per process setup: the fakes replace the OpenAI classes before anything under src is imported"""
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    from benchmarks import fakes
+    fakes.settings.update(llm_latency=0.0, embedding_latency=0.0)
+    fakes.install()
+
+
+def batch_token(writer_index, batch_index):
+    return f"w{writer_index}b{batch_index}"
+
+
+def writer(workdir, index, args, published, results):
+    enter_workdir(workdir)
+    from benchmarks import fakes
+    from src.config import Config
+    from src.vector_store.create_retriever import create_or_update_multi_vector_retriever
+    from src.vector_store.documents import delete_document
+    from src.vector_store.retriever_service import get_retriever_service
+
+    with contextlib.redirect_stdout(sys.stderr):
+        service = get_retriever_service()
+        state = service.get_index_state()
+        docstore = service.get_docstore()
+        fname = f"{index + 1:04d}.pdf"
+        rng = np.random.default_rng(args.seed + index)
+        commit_seconds, delete_seconds = [], []
+
+        for b in range(args.batches):
+            if args.reindex_every and b and b % args.reindex_every == 0:
+                # Readers stop expecting this document's batches before they disappear
+                for token, entry in published.items():
+                    if entry["document"] == fname:
+                        published[token] = dict(entry, deleted=True)
+                start_time = time.perf_counter()
+                delete_document(fname, Config.vectorstore, docstore, Config.bm25_index, index_state=state)
+                delete_seconds.append(time.perf_counter() - start_time)
+                for token, entry in published.items():
+                    if entry["document"] == fname:
+                        del published[token]
+
+            token = batch_token(index, b)
+            keys = [f"{token}-{i}" for i in range(args.batch_size)]
+            texts = [{key: f"{token} raw text {i}. " + " ".join(rng.choice(fakes.VOCABULARY, size=40))} for i, key in enumerate(keys)]
+            summaries = [{key: f"{token} summary {i}. " + " ".join(rng.choice(fakes.VOCABULARY, size=12))} for i, key in enumerate(keys)]
+            meta_node_info = {key: [{"filename": fname, "pagenumber": b + 1}] for key in keys}
+
+            start_time = time.perf_counter()
+            create_or_update_multi_vector_retriever(
+                Config.vectorstore, summaries, texts, [], [], [], [], meta_node_info, {},
+                docstore=docstore, image_store=Config.image_store, bm25_index=Config.bm25_index,
+                index_state=state,
+            )
+            commit_seconds.append(time.perf_counter() - start_time)
+            published[token] = {
+                "document": fname, "summary": summaries[0][keys[0]], "committed_at": time.time(), "version": docstore.version(),
+            }
+            if args.write_interval:
+                time.sleep(args.write_interval)
+
+    results.put(("writer", index, {"commit_seconds": commit_seconds, "delete_seconds": delete_seconds}))
+
+
+def find_batch(retriever, token, summary):
+    """Whether the app's retrieval for the batch's first summary returns that batch's entry"""
+    from src.rag.rag_chain import retrieve_sources
+    sources, _ = asyncio.run(retrieve_sources(retriever, summary))
+    return any(source["content"].startswith(token) for source in sources)
+
+
+def reader(workdir, index, args, published, stop, results):
+    enter_workdir(workdir)
+    from src.vector_store.retriever_service import get_retriever_service
+
+    with contextlib.redirect_stdout(sys.stderr):
+        service = get_retriever_service()
+        docstore = service.get_docstore()
+        service.load()
+        latencies, lags = [], {}
+        violations, misses, reads = [], 0, 0
+
+        while not stop.is_set():
+            start_time = time.perf_counter()
+            version = service.corpus_version()
+            for document, count in docstore.documents().items():
+                if count % args.batch_size:
+                    violations.append(f"{document} had {count} visible entries at version {version}")
+            # Oldest batches this reader has not found yet, among those committed by the version it reads
+            pending = sorted(
+                (entry["version"], token, entry) for token, entry in published.items()
+                if token not in lags and not entry.get("deleted") and entry["version"] <= version
+            )[:args.checks_per_read]
+            for _, token, entry in pending:
+                if find_batch(service.retriever, token, entry["summary"]):
+                    lags[token] = time.time() - entry["committed_at"]
+                else:
+                    misses += 1
+            latencies.append(time.perf_counter() - start_time)
+            reads += 1
+
+        # Once the writers are done, every surviving batch must be found
+        service.corpus_version()
+        final_misses = [
+            token for token, entry in published.items()
+            if not find_batch(service.retriever, token, entry["summary"])
+        ]
+
+    results.put(("reader", index, {
+        "reads": reads, "latencies": latencies, "lags": list(lags.values()), "misses": misses,
+        "violations": violations[:10], "violation_count": len(violations),
+        "final_misses": final_misses,
+    }))
+
+
+def verifier(workdir, args, published, results):
+    """A fresh process, so the vector index is loaded from what the writers persisted"""
+    enter_workdir(workdir)
+    from src.config import Config
+    from src.vector_store.retriever_service import get_retriever_service
+
+    with contextlib.redirect_stdout(sys.stderr):
+        service = get_retriever_service()
+        docstore = service.get_docstore()
+        service.load()
+        documents = [f"{i + 1:04d}.pdf" for i in range(args.writers)]
+        surviving = dict(published.items())
+        stored = sum(len(docstore.keys_for_document(document)) for document in documents)
+        missing = [
+            token for token, entry in surviving.items()
+            if not find_batch(service.retriever, token, entry["summary"])
+        ]
+        results.put(("verifier", 0, {
+            "expected_entries": len(surviving) * args.batch_size,
+            "docstore_entries": len(docstore),
+            "pending_entries": stored - len(docstore),
+            "chroma_entries": Config.vectorstore._collection.count(),
+            "bm25_entries": len(Config.bm25_index),
+            "missing_batches": missing,
+        }))
+
+
+def claimer(workdir, index, results):
+    enter_workdir(workdir)
+    from src.config import Config
+    from src.jobs.ingest_queue import JobStore
+
+    store = JobStore(Config.JOBS_DB_PATH)
+    claimed = []
+    while (job := store.claim(f"claimer-{index}", Config.JOB_LEASE_SECONDS)) is not None:
+        claimed.append(job[0])
+    results.put(("claimer", index, claimed))
+
+
+def run(args, workdir):
+    from benchmarks.end_to_end import percentiles
+
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    published = manager.dict()
+    stop = context.Event()
+    results = context.Queue()
+
+    def collect(count, processes):
+        collected = {}
+        while count:
+            try:
+                kind, index, result = results.get(timeout=1)
+            except queue.Empty:
+                # A process that died before reporting would otherwise be waited for forever
+                failed = [process.name for process in processes if process.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f"{', '.join(failed)} failed; see stderr")
+                continue
+            collected.setdefault(kind, {})[index] = result
+            count -= 1
+        return collected
+
+    # Create the stores once, so the processes do not race to create the Chroma collection
+    setup = context.Process(target=verifier, args=(workdir, args, published, results))
+    setup.start()
+    collect(1, [setup])
+    setup.join()
+
+    start_time = time.perf_counter()
+    readers = [context.Process(target=reader, args=(workdir, i, args, published, stop, results)) for i in range(args.readers)]
+    writers = [context.Process(target=writer, args=(workdir, i, args, published, results)) for i in range(args.writers)]
+    for process in readers + writers:
+        process.start()
+    written = collect(args.writers, readers + writers)
+    write_seconds = time.perf_counter() - start_time
+    stop.set()
+    read = collect(args.readers, readers)
+    for process in readers + writers:
+        process.join()
+
+    final = context.Process(target=verifier, args=(workdir, args, published, results))
+    final.start()
+    verified = collect(1, [final])["verifier"][0]
+    final.join()
+
+    from src.jobs.ingest_queue import JobStore
+    from src.config import Config
+    store = JobStore(Config.JOBS_DB_PATH)
+    job_ids = [store.create("src/uploads/", f"{i:04d}.pdf", None) for i in range(args.jobs)]
+    claimers = [context.Process(target=claimer, args=(workdir, i, results)) for i in range(args.claimers)]
+    for process in claimers:
+        process.start()
+    claims = [job_id for claimed in collect(args.claimers, claimers)["claimer"].values() for job_id in claimed]
+    for process in claimers:
+        process.join()
+
+    writers_report = written["writer"].values()
+    readers_report = read["reader"].values()
+    report = {
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "workdir", "keep")},
+        "write_seconds": round(write_seconds, 3),
+        "commits": sum(len(result["commit_seconds"]) for result in writers_report),
+        "commit": percentiles([seconds for result in writers_report for seconds in result["commit_seconds"]]),
+        "delete": percentiles([seconds for result in writers_report for seconds in result["delete_seconds"]]),
+        "reads": sum(result["reads"] for result in readers_report),
+        "read": percentiles([seconds for result in readers_report for seconds in result["latencies"]]),
+        "visibility_lag": percentiles([seconds for result in readers_report for seconds in result["lags"]]),
+        "reader_misses": sum(result["misses"] for result in readers_report),
+        "partial_batch_reads": sum(result["violation_count"] for result in readers_report),
+        "partial_batch_examples": [violation for result in readers_report for violation in result["violations"]][:10],
+        "final_reader_misses": sum(len(result["final_misses"]) for result in readers_report),
+        "final_state": verified,
+        "jobs": {"created": len(job_ids), "claimed": len(claims), "claimed_twice": len(claims) - len(set(claims)),
+                 "unclaimed": len(set(job_ids) - set(claims))},
+    }
+    report["ok"] = (
+        report["partial_batch_reads"] == 0
+        and report["final_reader_misses"] == 0
+        and not verified["missing_batches"]
+        and verified["pending_entries"] == 0
+        and verified["expected_entries"] == verified["docstore_entries"] == verified["chroma_entries"] == verified["bm25_entries"]
+        and report["jobs"]["claimed_twice"] == 0 and report["jobs"]["unclaimed"] == 0
+    )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=3)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--batches", type=int, default=40, help="Batches committed by each writer")
+    parser.add_argument("--batch-size", type=int, default=10, help="Entries per batch")
+    parser.add_argument("--reindex-every", type=int, default=15, help="Delete the writer's document every this many batches, 0 never")
+    parser.add_argument("--write-interval", type=float, default=0.0, help="Seconds between a writer's batches")
+    parser.add_argument("--checks-per-read", type=int, default=4, help="Committed batches a reader looks for per read")
+    parser.add_argument("--jobs", type=int, default=200, help="Ingest jobs raced for by the claimer processes")
+    parser.add_argument("--claimers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Scratch directory for the stores; a temporary one by default")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag-stress-"))
+    os.makedirs(workdir, exist_ok=True)
+    output = os.path.abspath(args.output) if args.output else None
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    # Inherited by the spawned processes
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # The processes share one local Chroma store
+    os.environ.setdefault("SYNC_LOCAL_CHROMA", "true")
+    # Vector search only, so a stale vector index is not masked by BM25 hits
+    os.environ.setdefault("HYBRID_RETRIEVAL", "false")
+
+    try:
+        report = run(args, workdir)
+    except RuntimeError as error:
+        report = {"ok": False, "error": str(error)}
+    finally:
+        os.chdir(REPO_ROOT)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    sys.exit(0 if report["ok"] else 1)
@@ -1,10 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, Response
 import os
+import json
+import re
 import asyncio
-import pandas as pd
-from src.main import process_new_pdf, query_vectorstore
+import hashlib
+import importlib
+import tempfile
+from src.main import query_vectorstore, stream_query_vectorstore, query_vectorstore_batch
+from src.vector_store.retriever_service import get_retriever_service
+from src.jobs.ingest_queue import IngestQueue, job_store
+from src.jobs.compaction import Compactor
+from src.vector_store.documents import delete_document, compact_stores
+from src.utils.image_utils import image_content_type
+from src.telemetry.metrics import registry
+from src.telemetry.tracing import setup_tracing
+from src.config import Config
 
 app = FastAPI()
 
@@ -17,70 +31,243 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Trace every request; spans are exported when OTEL_EXPORTER_OTLP_ENDPOINT is set
+setup_tracing(app, Config.OTEL_EXPORTER_OTLP_ENDPOINT, Config.OTEL_SERVICE_NAME)
+
 # Serve the static files (index.html)
 app.mount("/static", StaticFiles(directory="src/static", html=True), name="static")
 
 # Serve the uploads directory
 app.mount("/uploads", StaticFiles(directory="src/uploads"), name="uploads")
 
-# Path to the CSV file for storing mappings
-csv_file_path = "src/uploads/mapping.csv"
-
 # Ensure the uploads directory exists
 os.makedirs("src/uploads", exist_ok=True)
 
-# Initialize the CSV file if it doesn't exist
-if not os.path.exists(csv_file_path):
-    df = pd.DataFrame(columns=["original_filename", "id_filename", "file_size"])
-    df.to_csv(csv_file_path, index=False)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def process_new_pdf(fpath, fname, progress=None):
+    # The PDF partitioning and vision stack is imported by the first ingest, off the event loop, rather than at startup
+    ingest = await asyncio.to_thread(importlib.import_module, "src.ingest")
+    await ingest.process_new_pdf(fpath, fname, progress)
+
+def require_ingest():
+    if Config.QUERY_ONLY:
+        raise HTTPException(status_code=503, detail="This replica only serves queries; send uploads to an ingest replica")
+
+# Ingests run in the background, in whichever worker process claims them; jobs left unfinished by a restart
+# are resumed once their lease expires
+ingest_queue = IngestQueue(job_store, process_new_pdf, Config.INGEST_WORKERS)
+
+# Space left by deleted documents is reclaimed in the background
+compactor = Compactor(
+    lambda: compact_stores(
+        get_retriever_service().get_docstore(), Config.bm25_index, Config.image_store, Config.BLOB_GC_GRACE_SECONDS
+    )
+)
+
+@app.on_event("startup")
+async def load_retriever():
+    # Load the docstore once so queries don't deserialize it per request
+    await asyncio.to_thread(get_retriever_service().load)
+    # Query-only replicas leave queued jobs to an ingest replica
+    if not Config.QUERY_ONLY:
+        await ingest_queue.start()
+
+@app.on_event("shutdown")
+async def stop_ingest_queue():
+    await ingest_queue.stop()
+    await compactor.stop()
 
 @app.post("/upload/")
 async def upload_pdf(file: UploadFile = File(...)):
-    # Read the file content to calculate its size
-    file_content = await file.read()
-    file_size = len(file_content)
-    
-    # Load the CSV file into a DataFrame
-    df = pd.read_csv(csv_file_path)
-    
-    # Check for duplicate files
-    duplicate = df[(df["original_filename"] == file.filename) & (df["file_size"] == file_size)]
-    if not duplicate.empty:
-        return {"filename": file.filename, 
-                "message":"Duplicate detected. Using the cached Document",
-                "status":"processed", 
-                "id_filename": duplicate.iloc[0]["id_filename"]}
-    
-    # Determine the new ID for the file
-    id_number = len(df) + 1
-    id_filename = f"{id_number:04d}.pdf"
-    
-    # Save the uploaded file with the new ID
-    file_path = os.path.join("src/uploads", id_filename)
-    with open(file_path, "wb") as buffer:
-        buffer.write(file_content)
-    
-    # Save the mapping to the DataFrame and then to the CSV file
-    new_row = {"original_filename": file.filename, "id_filename": id_filename, "file_size": file_size}
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv(csv_file_path, index=False)
+    require_ingest()
+    # Stream the upload to a temporary file, hashing it on the way, so it never sits in memory whole
+    digest = hashlib.sha256()
+    file_size = 0
+    fd, temp_path = tempfile.mkstemp(dir="src/uploads", prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                file_size += len(chunk)
+                buffer.write(chunk)
+
+        # Allocates the ID atomically, or returns the document already uploaded with the same content
+        document, created = await asyncio.to_thread(
+            Config.document_registry.register, file.filename, file_size, digest.hexdigest()
+        )
+        id_filename = document["id_filename"]
+        if not created:
+            # The document is registered before it is ingested, so its ingest may still be queued, running or have failed
+            active_jobs = await asyncio.to_thread(job_store.active_for, id_filename)
+            if active_jobs:
+                job = await asyncio.to_thread(job_store.get, active_jobs[0])
+                return {"filename": file.filename,
+                        "message": "Duplicate detected. The Document is being ingested",
+                        "status": job["status"],
+                        "id_filename": id_filename,
+                        "job_id": job["id"]}
+            entries = await asyncio.to_thread(get_retriever_service().get_docstore().keys_for_document, id_filename)
+            if entries:
+                return {"filename": file.filename, 
+                        "message":"Duplicate detected. Using the cached Document",
+                        "status":"processed", 
+                        "id_filename": id_filename}
+
+        pdf_path = os.path.join("src/uploads", id_filename)
+        if created or not os.path.exists(pdf_path):
+            os.replace(temp_path, pdf_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
     
-    # Process the new PDF
-    await process_new_pdf("src/uploads/", id_filename)
+    # Queue the new PDF for processing, or again if its earlier ingest left no entries
+    job_id = ingest_queue.submit("src/uploads/", id_filename, file.filename)
     
     return {"filename": file.filename, 
             "id_filename": id_filename, 
-            "status": "processed", 
-            "message": "Upload Successful"}
+            "job_id": job_id,
+            "status": "queued", 
+            "message": "Upload Successful" if created else "Duplicate detected. Its earlier ingest left no entries, so it is ingested again"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def check_id_filename(id_filename):
+    if not re.fullmatch(r"\d{4,}\.pdf", id_filename):
+        raise HTTPException(status_code=404, detail="Document not found")
+
+async def require_no_active_job(id_filename, action):
+    # An ingest commits page range by page range, so one still running would write entries after the deletion
+    # or alongside those of another ingest of the same document
+    active_jobs = await asyncio.to_thread(job_store.active_for, id_filename)
+    if active_jobs:
+        raise HTTPException(
+            status_code=409, detail=f"Document is being ingested (job {active_jobs[0]}); {action} it once the job is done"
+        )
+
+@app.get("/documents/")
+async def list_documents():
+    """Number of indexed entries per document"""
+    counts = await asyncio.to_thread(get_retriever_service().get_docstore().documents)
+    return {"documents": counts}
+
+@app.get("/documents/{id_filename}")
+async def get_document(id_filename: str):
+    """Manifest of the doc_ids indexed for a document"""
+    check_id_filename(id_filename)
+    doc_ids = await asyncio.to_thread(get_retriever_service().get_docstore().keys_for_document, id_filename)
+    if not doc_ids and not os.path.exists(os.path.join("src/uploads", id_filename)):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"id_filename": id_filename, "entries": len(doc_ids), "doc_ids": doc_ids}
+
+@app.delete("/documents/{id_filename}")
+async def delete_pdf(id_filename: str):
+    """Remove a document from the indexes, the uploads and the registry, then compact in the background"""
+    check_id_filename(id_filename)
+    await require_no_active_job(id_filename, "delete")
+    pdf_path = os.path.join("src/uploads", id_filename)
+    service = get_retriever_service()
+    removed = await asyncio.to_thread(
+        delete_document, id_filename, Config.vectorstore, service.get_docstore(), Config.bm25_index,
+        index_state=service.get_index_state(),
+    )
+    if not removed and not os.path.exists(pdf_path):
+        raise HTTPException(status_code=404, detail="Document not found")
+    if os.path.exists(pdf_path):
+        os.remove(pdf_path)
+    await asyncio.to_thread(Config.document_registry.delete, id_filename)
+    compactor.request()
+    return {"id_filename": id_filename, "removed_entries": removed, "status": "deleted"}
+
+@app.post("/documents/{id_filename}/reindex")
+async def reindex_pdf(id_filename: str):
+    """Ingest an uploaded document again; its earlier entries are replaced when the new ones are indexed"""
+    require_ingest()
+    check_id_filename(id_filename)
+    if not os.path.exists(os.path.join("src/uploads", id_filename)):
+        raise HTTPException(status_code=404, detail="Document not found")
+    await require_no_active_job(id_filename, "reindex")
+    document = await asyncio.to_thread(Config.document_registry.get, id_filename)
+    original_filename = document["original_filename"] if document else None
+    job_id = ingest_queue.submit("src/uploads/", id_filename, original_filename)
+    return {"id_filename": id_filename, "job_id": job_id, "status": "queued"}
+
+@app.get("/metrics")
+async def metrics():
+    """Stage durations, LLM calls and tokens and embedding counts of this process, in the Prometheus text format"""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/images/{key}")
+async def get_image(key: str):
+    """Image blob (original, prompt variant or thumbnail) by the content hash stored in the docstore"""
+    if not re.fullmatch(r"[0-9a-f]{64}", key) or not Config.image_store.exists(key):
+        raise HTTPException(status_code=404, detail="Image not found")
+    data = await asyncio.to_thread(Config.image_store.get, key)
+    return Response(
+        content=data,
+        media_type=image_content_type(data) or "application/octet-stream",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
 
 @app.get("/query/")
-async def query_pdf(query: str):
+async def query_pdf(query: str, id_filename: Optional[List[str]] = Query(None)):
+    """id_filename: optional, repeatable; restricts retrieval to those uploaded documents"""
     try:
-        result = await query_vectorstore(query)
+        result = await query_vectorstore(query, id_filename)
         return {"query": query, "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/query/stream")
+async def query_pdf_stream(query: str, id_filename: Optional[List[str]] = Query(None)):
+    """
+    Server-sent events: a "metadata" event with the ranked source metadata (for /get_context/),
+    then a "token" event per answer chunk and a final "done" event with the timings.
+    """
+    async def events():
+        try:
+            async for event, data in stream_query_vectorstore(query, id_filename):
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/query/batch")
+async def query_pdf_batch(request: Request):
+    """
+    Body: {"queries": [...], "id_filenames": [...]} with id_filenames optional. Streams one JSON line per query as it completes,
+    with its position in the request as "index" and either "result" or "error".
+    """
+    data = await request.json()
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries or not all(isinstance(query, str) for query in queries):
+        raise HTTPException(status_code=400, detail="Expected a non-empty list of query strings")
+    id_filenames = data.get("id_filenames")
+    if id_filenames is not None and not (isinstance(id_filenames, list) and all(isinstance(name, str) for name in id_filenames)):
+        raise HTTPException(status_code=400, detail="id_filenames must be a list of strings")
+
+    async def lines():
+        try:
+            async for item in query_vectorstore_batch(queries, id_filenames):
+                yield json.dumps(item) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.post("/get_context/")
 async def get_context(request: Request):
     data = await request.json()
@@ -1,10 +1,132 @@
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 import os
+import threading
+
+_lazy_lock = threading.RLock()
+
+class lazy_attribute:
+    """
+    Class attribute built on first access and then stored on the class in place of the descriptor,
+    so importing Config never opens stores or imports their dependencies.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = factory.__name__
+
+    def __get__(self, instance, owner):
+        with _lazy_lock:
+            value = owner.__dict__.get(self.name, self)
+            if value is self:
+                value = self.factory(owner)
+                setattr(owner, self.name, value)
+        return value
 
 class Config:
-    vectorstore = Chroma(
-        collection_name="mm_rag_doc_gpt",
-        embedding_function=OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY")),
-        persist_directory="./chroma_store" 
-    )
\ No newline at end of file
+    DOCSTORE_PATH = "./docstore.sqlite3"
+    LEGACY_DOCSTORE_PATH = "./docstore.pkl"
+    IMAGE_STORE_PATH = "./image_store"
+    SUMMARY_CACHE_PATH = "./summary_cache.sqlite3"
+    SUMMARY_CACHE_MAX_ENTRIES = 50000
+    EMBEDDING_CACHE_PATH = "./embedding_cache.sqlite3"
+    JOBS_DB_PATH = "./jobs.sqlite3"
+    BM25_INDEX_PATH = "./bm25_index.sqlite3"
+    UPLOAD_DIR = "src/uploads"
+    DOCUMENT_REGISTRY_PATH = "./documents.sqlite3"
+    # Imported into the registry once, when the registry is empty
+    LEGACY_MAPPING_CSV_PATH = "src/uploads/mapping.csv"
+    # Unreferenced image blobs younger than this are kept by compaction, as an ingest may be about to reference them
+    BLOB_GC_GRACE_SECONDS = 3600
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+    # A running ingest job whose worker has not reported for this long is taken over by another worker
+    JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+    # How often idle ingest workers look for jobs submitted to, or abandoned by, other worker processes
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+    # Serializes index writes across worker processes on this host
+    INDEX_LOCK_PATH = "./index.lock"
+    # Use a Chroma server instead of the local ./chroma_store, e.g. for replicas on several hosts
+    CHROMA_HOST = os.getenv("CHROMA_HOST")
+    CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+    # Worker processes serving the index (uvicorn reads --workers from WEB_CONCURRENCY too); more than 1 requires CHROMA_HOST
+    WORKER_PROCESSES = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # Opt in to sharing the local ./chroma_store between processes by replaying Chroma's log, which uses chromadb 0.5.3 internals
+    SYNC_LOCAL_CHROMA = os.getenv("SYNC_LOCAL_CHROMA", "false").lower() == "true"
+
+    # Point the OpenAI clients at another server, e.g. a local fake for load testing
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+    # Budgets enforced by the shared LLM scheduler
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_MAX_RETRIES = 6
+    # Processes used to partition page ranges of a PDF in parallel; 1 partitions the whole file in-process
+    PARTITION_WORKERS = int(os.getenv("PARTITION_WORKERS", "1"))
+    PARTITION_PAGES_PER_TASK = int(os.getenv("PARTITION_PAGES_PER_TASK", "4"))
+    # Page-range batches buffered between the extract, summarize and index stages of an ingest
+    INGEST_PIPELINE_DEPTH = int(os.getenv("INGEST_PIPELINE_DEPTH", "2"))
+
+    # Reranking strategy: "embedding" (stored summary vectors), "tfidf" or "cross_encoder"
+    RERANKER = os.getenv("RERANKER", "embedding")
+    # Text rerankers only: "vision" re-summarizes retrieved images per query, "summary" reranks on the ingest-time summary
+    RERANK_IMAGE_MODE = os.getenv("RERANK_IMAGE_MODE", "vision")
+    RERANK_MAX_CONCURRENCY = int(os.getenv("RERANK_MAX_CONCURRENCY", "4"))
+    RERANK_CACHE_SIZE = 1024
+    RERANK_CACHE_TTL = 3600
+
+    # Merge BM25 hits over summaries and raw text with the vector hits, by reciprocal-rank fusion
+    HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+    RRF_K = 60
+
+    # Answers cached per corpus version; queries whose embedding is at least this similar to a cached one reuse its answer
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97"))
+    # Context packed into the answer prompt: text tokens plus a fixed cost per image, and at most this many images
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+    CONTEXT_MAX_IMAGES = int(os.getenv("CONTEXT_MAX_IMAGES", "3"))
+    # A text that does not fit is truncated only if at least this many tokens are left for it
+    CONTEXT_MIN_TRUNCATED_TOKENS = 200
+    # Queries of a /query/batch request that are reranked and answered at the same time
+    BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", "8"))
+
+    # Query-only replicas serve retrieval and answers but never import the PDF partitioning and ingest stack;
+    # uploads and reindexing are rejected and queued ingest jobs are left to an ingest replica
+    QUERY_ONLY = os.getenv("QUERY_ONLY", "false").lower() == "true"
+
+    # Request and pipeline stage spans go to this OTLP collector (gRPC) when set; /metrics is always served
+    OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "multimodal-rag")
+
+    @lazy_attribute
+    def image_store(cls):
+        from src.vector_store.blob_store import ImageBlobStore
+        return ImageBlobStore(cls.IMAGE_STORE_PATH)
+
+    @lazy_attribute
+    def bm25_index(cls):
+        from src.vector_store.bm25_index import BM25Index
+        return BM25Index(cls.BM25_INDEX_PATH)
+
+    @lazy_attribute
+    def document_registry(cls):
+        from src.vector_store.document_registry import load_registry
+        return load_registry(cls.DOCUMENT_REGISTRY_PATH, cls.LEGACY_MAPPING_CSV_PATH, cls.UPLOAD_DIR)
+
+    @lazy_attribute
+    def vectorstore(cls):
+        from langchain_chroma import Chroma
+        from langchain_openai import OpenAIEmbeddings
+        from src.vector_store.embedding_cache import CachedEmbeddings
+        embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"), base_url=cls.OPENAI_BASE_URL), cls.EMBEDDING_CACHE_PATH
+        )
+        if cls.CHROMA_HOST:
+            import chromadb
+            return Chroma(
+                collection_name="mm_rag_doc_gpt",
+                embedding_function=embeddings,
+                client=chromadb.HttpClient(host=cls.CHROMA_HOST, port=cls.CHROMA_PORT),
+            )
+        return Chroma(
+            collection_name="mm_rag_doc_gpt",
+            embedding_function=embeddings,
+            persist_directory="./chroma_store" 
+        )
\ No newline at end of file
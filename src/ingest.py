@@ -0,0 +1,166 @@
+import asyncio
+import contextlib
+import time
+from src.pdf_processing.pdf_processing import iter_pdf_element_batches, categorize_elements, generate_meta_info, extract_images
+from src.summarization.text_summary import generate_text_summaries
+from src.summarization.image_summary import generate_img_summaries, process_image_summaries
+from src.vector_store.create_retriever import create_or_update_multi_vector_retriever
+from src.vector_store.retriever_service import get_retriever_service
+from src.vector_store.documents import document_entries, delete_entries
+from src.telemetry.tracing import stage
+from src.config import Config
+
+async def run_pipeline(*stages):
+    """Run pipeline stages concurrently; the first one to fail cancels the others and its error is raised"""
+    tasks = [asyncio.create_task(coroutine) for coroutine in stages]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def page_span(elements):
+    pages = [element.metadata.page_number for element in elements if element.metadata.page_number is not None]
+    return (min(pages), max(pages)) if pages else (None, None)
+
+async def process_new_pdf(fpath, fname, progress=None):
+    """
+    Ingest one PDF into the vectorstore and docstore.
+    Page ranges flow through extraction, summarization and indexing concurrently, connected by queues of
+    Config.INGEST_PIPELINE_DEPTH batches, so memory stays flat and pages become searchable as each range is indexed.
+    Re-ingesting a document replaces its earlier entries once the last range is indexed; until then both are searchable.
+    If the ingest fails, what it indexed is removed again and the earlier entries stay.
+    progress: optional StageTracker, told each time a range enters a stage (extract, categorize, summarize, index)
+    and how long the stage took on it
+    """
+
+    @contextlib.asynccontextmanager
+    async def busy(stage_name):
+        # The tracker writes to the job store, so it is called off the event loop
+        if progress is None:
+            yield
+            return
+        await asyncio.to_thread(progress, stage_name)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(progress.add, stage_name, time.perf_counter() - start_time)
+
+    ingest_start = time.time()
+    print("Starting PDF processing...")
+
+    # Entries of an earlier ingest, or of a resumed job's interrupted attempt, are replaced when this one is done,
+    # so the document stays searchable meanwhile and repeated jobs leave no duplicates
+    service = get_retriever_service()
+    earlier = await asyncio.to_thread(document_entries, fname, Config.vectorstore, service.get_docstore())
+
+    async def remove(doc_ids):
+        return await asyncio.to_thread(
+            delete_entries, doc_ids, Config.vectorstore, service.get_docstore(), Config.bm25_index,
+            index_state=service.get_index_state(),
+        )
+
+    to_summarize = asyncio.Queue(maxsize=Config.INGEST_PIPELINE_DEPTH)
+    to_index = asyncio.Queue(maxsize=Config.INGEST_PIPELINE_DEPTH)
+
+    async def extract():
+        # Partitioning is CPU-bound, so every range is awaited off the event loop
+        batches = iter_pdf_element_batches(fpath, fname)
+        try:
+            while True:
+                start_time = time.time()
+                async with busy("extract"):
+                    with stage("partition", document=fname):
+                        raw_pdf_elements = await asyncio.to_thread(next, batches, None)
+                if raw_pdf_elements is None:
+                    break
+                first_page, last_page = page_span(raw_pdf_elements)
+                print(f"Pages {first_page}-{last_page} partitioned. Time taken: {time.time() - start_time:.2f} seconds")
+
+                async with busy("categorize"):
+                    with stage("categorize", document=fname):
+                        texts, tables = categorize_elements(raw_pdf_elements)
+                    with stage("meta_info", document=fname):
+                        meta_node_info, img_nodes_info = await asyncio.to_thread(generate_meta_info, raw_pdf_elements, fname)
+                    # Images are extracted in memory, so concurrent ingests don't share a figures directory
+                    images = extract_images(raw_pdf_elements)
+                await to_summarize.put({
+                    "pages": (first_page, last_page), "texts": texts, "tables": tables, "images": images,
+                    "meta_node_info": meta_node_info, "img_nodes_info": img_nodes_info,
+                })
+        finally:
+            try:
+                batches.close()
+            except ValueError:
+                # Cancelled while a range was still being partitioned in its thread
+                pass
+        await to_summarize.put(None)
+
+    async def summarize_texts(batch):
+        with stage("text_summary", document=fname, texts=len(batch["texts"]), tables=len(batch["tables"])):
+            return await generate_text_summaries(batch["texts"], batch["tables"])
+
+    async def summarize_images(batch):
+        with stage("image_summary", document=fname, images=len(batch["images"])):
+            return await generate_img_summaries(batch["images"], batch["img_nodes_info"])
+
+    async def summarize():
+        while (batch := await to_summarize.get()) is not None:
+            start_time = time.time()
+            async with busy("summarize"):
+                (text_summaries, table_summaries), (img_bytes_list, image_summaries, image_info) = await asyncio.gather(
+                    summarize_texts(batch), summarize_images(batch)
+                )
+                with stage("image_meta_info", document=fname):
+                    img_nodes_info = process_image_summaries(
+                        image_summaries, img_bytes_list, image_info, batch["meta_node_info"], fname
+                    )
+            print(f"Pages {batch['pages'][0]}-{batch['pages'][1]} summarized. Time taken: {time.time() - start_time:.2f} seconds")
+            await to_index.put(dict(
+                batch, text_summaries=text_summaries, table_summaries=table_summaries,
+                image_summaries=image_summaries, img_bytes_list=img_bytes_list, img_nodes_info=img_nodes_info,
+            ))
+        await to_index.put(None)
+
+    async def index():
+        while (batch := await to_index.get()) is not None:
+            start_time = time.time()
+            async with busy("index"):
+                with stage("index", document=fname):
+                    await asyncio.to_thread(
+                        create_or_update_multi_vector_retriever,
+                        Config.vectorstore,
+                        batch["text_summaries"],
+                        batch["texts"],
+                        batch["table_summaries"],
+                        batch["tables"],
+                        batch["image_summaries"],
+                        batch["img_bytes_list"],
+                        batch["meta_node_info"],
+                        batch["img_nodes_info"],
+                        docstore=service.get_docstore(),
+                        image_store=Config.image_store,
+                        bm25_index=Config.bm25_index,
+                        index_state=service.get_index_state(),
+                    )
+            print(f"Pages {batch['pages'][0]}-{batch['pages'][1]} indexed and searchable. Time taken: {time.time() - start_time:.2f} seconds")
+
+    try:
+        await run_pipeline(extract(), summarize(), index())
+    except Exception:
+        indexed = await asyncio.to_thread(document_entries, fname, Config.vectorstore, service.get_docstore())
+        partial = sorted(set(indexed) - set(earlier))
+        if partial:
+            await remove(partial)
+            print(f"Ingest of {fname} failed; removed the {len(partial)} entries it had indexed")
+        raise
+    if earlier:
+        async with busy("index"):
+            removed = await remove(earlier)
+        print(f"Replaced {removed} earlier entries of {fname}")
+    print(f"PDF processed. Time taken: {time.time() - ingest_start:.2f} seconds")
+    print(f"Embedding cache: {Config.vectorstore.embeddings.stats()}")
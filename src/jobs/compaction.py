@@ -0,0 +1,34 @@
+import asyncio
+import traceback
+
+
+class Compactor:
+    """
+    Runs a compaction function in a background thread.
+    Requests that arrive while a run is in progress are coalesced into one more run after it.
+    """
+
+    def __init__(self, compact):
+        self.compact = compact
+        self._task = None
+        self._pending = False
+
+    def request(self):
+        if self._task is not None and not self._task.done():
+            self._pending = True
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._pending = False
+            try:
+                await asyncio.to_thread(self.compact)
+            except Exception:
+                traceback.print_exc()
+            if not self._pending:
+                return
+
+    async def stop(self):
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from src.telemetry.tracing import stage
+from src.config import Config
+
+
+class JobStore:
+    """
+    SQLite-backed record of ingest jobs, so queued work survives a restart.
+    It is also the queue shared by every worker process: a job runs in whichever worker claims it first.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                fpath TEXT NOT NULL,
+                fname TEXT NOT NULL,
+                original_filename TEXT,
+                status TEXT NOT NULL,
+                stage TEXT,
+                stage_timings TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        if "owner" not in [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.commit()
+
+    def create(self, fpath, fname, original_filename):
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, fpath, fname, original_filename, status, stage, stage_timings, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', NULL, '{}', ?, ?)",
+                (job_id, fpath, fname, original_filename, now, now),
+            )
+        return job_id
+
+    def update(self, job_id, **fields):
+        if "stage_timings" in fields:
+            fields["stage_timings"] = json.dumps(fields["stage_timings"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            columns = [column[0] for column in cursor.description]
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        job["stage_timings"] = json.loads(job["stage_timings"])
+        return job
+
+    def active_for(self, fname):
+        """ids of the queued or running jobs that ingest the file"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE fname = ? AND status IN ('queued', 'running') ORDER BY created_at", (fname,)
+            ).fetchall()
+        return [job_id for (job_id,) in rows]
+
+    def claim(self, owner, lease_seconds):
+        """
+        Take the oldest queued job, or a running one whose worker has not updated it for lease_seconds,
+        e.g. because it was restarted. Returns (id, fpath, fname, resumed), or None if there is nothing to run.
+        """
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE also serializes against other processes using the same file, so a job is claimed once
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, fpath, fname, status FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND updated_at < ?) ORDER BY created_at LIMIT 1",
+                    (now - lease_seconds,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, updated_at = ? WHERE id = ?", (owner, now, row[0])
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        if row is None:
+            return None
+        job_id, fpath, fname, status = row
+        return job_id, fpath, fname, status == "running"
+
+
+class StageTracker:
+    """
+    Records the stage a job is in and how long it has spent in each stage.
+    Every call writes to the job store, so async callers run it in a thread.
+    Ingest is pipelined over page ranges, so its stages overlap: each timing adds up the time the stage was busy
+    with any range, and together they can exceed the job's duration. The stage is the one a range entered last.
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.timings = {}
+
+    def __call__(self, stage):
+        self.store.update(self.job_id, stage=stage)
+
+    def add(self, stage, seconds):
+        self.timings[stage] = round(self.timings.get(stage, 0) + seconds, 3)
+        self.store.update(self.job_id, stage_timings=self.timings)
+
+    def finish(self, status, error=None):
+        self.store.update(self.job_id, status=status, stage=None, stage_timings=self.timings, error=error)
+
+
+class IngestQueue:
+    """
+    Runs ingest jobs on a bounded pool of asyncio workers.
+    The blocking parts of an ingest run in threads, so the event loop keeps serving queries.
+    Jobs are claimed from the job store, so several processes can share it: a new job wakes a worker of the
+    process it was submitted to, and idle workers poll for jobs left by other processes. A running job is
+    kept alive every third of the lease; one whose process died is resumed by another worker once its lease expires.
+    """
+
+    def __init__(self, store, process, workers, lease_seconds=None, poll_seconds=None):
+        self.store = store
+        self.process = process
+        self.workers = workers
+        self.lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+        self.poll_seconds = poll_seconds or Config.JOB_POLL_SECONDS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeups = None
+        self._tasks = []
+
+    async def start(self):
+        self._wakeups = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, fpath, fname, original_filename=None):
+        job_id = self.store.create(fpath, fname, original_filename)
+        if self._wakeups is not None:
+            self._wakeups.put_nowait(None)
+        return job_id
+
+    async def _keep_alive(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await asyncio.to_thread(self.store.update, job_id)
+
+    async def _worker(self):
+        while True:
+            claimed = await asyncio.to_thread(self.store.claim, self.owner, self.lease_seconds)
+            if claimed is None:
+                try:
+                    await asyncio.wait_for(self._wakeups.get(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id, fpath, fname, resumed = claimed
+            if resumed:
+                print(f"Resuming ingest job {job_id} for {fname}")
+            tracker = StageTracker(self.store, job_id)
+            keep_alive = asyncio.create_task(self._keep_alive(job_id))
+            try:
+                # One trace per job, with the pipeline stages as its children
+                with stage("ingest", job_id=job_id, document=fname):
+                    await self.process(fpath, fname, progress=tracker)
+                await asyncio.to_thread(tracker.finish, "done")
+            except Exception:
+                traceback.print_exc()
+                await asyncio.to_thread(tracker.finish, "failed", error=traceback.format_exc(limit=3))
+            finally:
+                keep_alive.cancel()
+
+
+job_store = JobStore(Config.JOBS_DB_PATH)
@@ -0,0 +1,231 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import os
+import random
+import time
+import weakref
+import openai
+from src.config import Config
+from src.telemetry.metrics import llm_calls, llm_tokens
+from src.telemetry.tracing import current_stage
+
+# Lower values are admitted first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+# Rough token cost of an image part, used until the real usage is known
+IMAGE_TOKEN_ESTIMATE = 1000
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Cheap local estimate of prompt plus completion tokens, used to reserve budget before a call"""
+    tokens = max_tokens or 256
+    for message in messages:
+        content = message.content
+        parts = content if isinstance(content, list) else [content]
+        for part in parts:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                tokens += IMAGE_TOKEN_ESTIMATE
+            else:
+                text = part.get("text", "") if isinstance(part, dict) else str(part)
+                tokens += len(text) // 4
+    return tokens
+
+def usage_tokens(message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    return message.response_metadata.get("token_usage", {}).get("total_tokens")
+
+def model_name(model):
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+
+def record_call(model, outcome, message=None):
+    """Count a call and, if the response reported them, its tokens, under the pipeline stage that made it"""
+    name, stage = model_name(model), current_stage.get()
+    llm_calls.inc(model=name, stage=stage, outcome=outcome)
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        llm_tokens.inc(usage.get("input_tokens", 0), model=name, stage=stage, kind="prompt")
+        llm_tokens.inc(usage.get("output_tokens", 0), model=name, stage=stage, kind="completion")
+
+
+class _LoopState:
+    def __init__(self):
+        self.condition = asyncio.Condition()
+        self.waiting = []
+        self.in_flight = 0
+
+
+class LLMScheduler:
+    """
+    Central dispatcher for all chat model calls.
+    Calls are admitted in priority order, so interactive query traffic overtakes queued background ingest,
+    and only while the requests-per-minute, tokens-per-minute and concurrency budgets allow.
+    Retryable API errors are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, rpm, tpm, max_concurrency, max_retries, base_delay=1.0, max_delay=60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # [timestamp, tokens] of every call admitted in the last minute
+        self._window = collections.deque()
+        self._seq = itertools.count()
+        self._states = weakref.WeakKeyDictionary()
+        self.retries = 0
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._states:
+            self._states[loop] = _LoopState()
+        return self._states[loop]
+
+    def _budget_delay(self, tokens):
+        """Seconds until a call of this size fits the per-minute budgets, 0 if it fits now"""
+        now = time.monotonic()
+        while self._window and self._window[0][0] <= now - 60:
+            self._window.popleft()
+        used_tokens = sum(entry[1] for entry in self._window)
+        if not self._window or (len(self._window) < self.rpm and used_tokens + tokens <= self.tpm):
+            return 0
+        return self._window[0][0] + 60 - now
+
+    async def _acquire(self, priority, tokens):
+        state = self._state()
+        entry = [priority, next(self._seq)]
+        async with state.condition:
+            heapq.heappush(state.waiting, entry)
+            try:
+                while True:
+                    timeout = None
+                    if state.waiting[0] is entry and state.in_flight < self.max_concurrency:
+                        timeout = self._budget_delay(tokens)
+                        if timeout <= 0:
+                            heapq.heappop(state.waiting)
+                            state.in_flight += 1
+                            reservation = [time.monotonic(), tokens]
+                            self._window.append(reservation)
+                            state.condition.notify_all()
+                            return reservation
+                    try:
+                        await asyncio.wait_for(state.condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in state.waiting:
+                    state.waiting.remove(entry)
+                    heapq.heapify(state.waiting)
+                    state.condition.notify_all()
+                raise
+
+    async def _release(self):
+        state = self._state()
+        async with state.condition:
+            state.in_flight -= 1
+            state.condition.notify_all()
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+    async def ainvoke(self, model, messages, priority=BACKGROUND):
+        tokens = estimate_tokens(messages, getattr(model, "max_tokens", None))
+        for attempt in range(self.max_retries + 1):
+            reservation = await self._acquire(priority, tokens)
+            try:
+                message = await model.ainvoke(messages)
+            except RETRYABLE_ERRORS as error:
+                if attempt == self.max_retries:
+                    record_call(model, "error")
+                    raise
+                record_call(model, "retry")
+                self.retries += 1
+                delay = self._backoff(attempt, error)
+            except Exception:
+                record_call(model, "error")
+                raise
+            else:
+                # Replace the reservation with the real usage once it is known
+                reservation[1] = usage_tokens(message) or tokens
+                record_call(model, "success", message)
+                return message
+            finally:
+                await self._release()
+            await asyncio.sleep(delay)
+
+    async def astream(self, model, messages, priority=BACKGROUND):
+        """Like ainvoke, but yields message chunks as they arrive. A call is only retried before its first chunk."""
+        tokens = estimate_tokens(messages, getattr(model, "max_tokens", None))
+        for attempt in range(self.max_retries + 1):
+            reservation = await self._acquire(priority, tokens)
+            started = False
+            usage = None
+            try:
+                async for chunk in model.astream(messages):
+                    started = True
+                    # Only the final chunk carries usage, and only when the model is asked to stream it
+                    usage = chunk if getattr(chunk, "usage_metadata", None) else usage
+                    yield chunk
+                reservation[1] = (usage_tokens(usage) if usage else None) or tokens
+                record_call(model, "success", usage)
+                return
+            except RETRYABLE_ERRORS as error:
+                if started or attempt == self.max_retries:
+                    record_call(model, "error")
+                    raise
+                record_call(model, "retry")
+                self.retries += 1
+                delay = self._backoff(attempt, error)
+            except Exception:
+                record_call(model, "error")
+                raise
+            finally:
+                await self._release()
+            await asyncio.sleep(delay)
+
+
+_models = {}
+
+def get_chat_model(model, **kwargs):
+    """
+    Shared ChatOpenAI client per configuration.
+    Retries are left to the scheduler, and OPENAI_BASE_URL can point the clients at a local fake server.
+    Streamed responses end with their token usage, so streamed calls are counted and budgeted like the others.
+    """
+    key = (model, tuple(sorted(kwargs.items())))
+    if key not in _models:
+        from langchain_openai import ChatOpenAI
+        _models[key] = ChatOpenAI(
+            model=model,
+            max_retries=0,
+            stream_usage=True,
+            base_url=Config.OPENAI_BASE_URL,
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            **kwargs,
+        )
+    return _models[key]
+
+
+llm_scheduler = LLMScheduler(
+    rpm=Config.LLM_REQUESTS_PER_MINUTE,
+    tpm=Config.LLM_TOKENS_PER_MINUTE,
+    max_concurrency=Config.LLM_MAX_CONCURRENCY,
+    max_retries=Config.LLM_MAX_RETRIES,
+)
@@ -1,115 +1,156 @@
 import asyncio
 import time
-from src.pdf_processing.pdf_processing import extract_pdf_elements, categorize_elements, generate_meta_info
-from src.summarization.text_summary import generate_text_summaries
-from src.summarization.image_summary import generate_img_summaries, process_image_summaries
-from src.vector_store.create_retriever import create_or_update_multi_vector_retriever, load_in_memory_store
-from src.rag.rag_chain import multi_modal_rag_chain_with_reranking
-from langchain.retrievers.multi_vector import MultiVectorRetriever
+from src.vector_store.retriever_service import get_retriever_service
+from src.rag.answer_cache import answer_cache, AnswerCache
+from src.telemetry.tracing import stage
 from src.config import Config
-import os
-
-async def process_new_pdf(fpath, fname):
-    print("Starting PDF processing...")
-
-    # Get elements
-    start_time = time.time()
-    print("Extracting PDF elements...")
-    raw_pdf_elements = extract_pdf_elements(fpath, fname)
-    print(f"PDF elements extracted. Time taken: {time.time() - start_time:.2f} seconds")
-
-    # Get text, tables
-    start_time = time.time()
-    print("Categorizing elements into text and tables...")
-    texts, tables = categorize_elements(raw_pdf_elements)
-    print(f"Elements categorized. Time taken: {time.time() - start_time:.2f} seconds")
-
-    # Generate meta info
-    start_time = time.time()
-    print("Generating meta information...")
-    meta_node_info, img_nodes_info = generate_meta_info(raw_pdf_elements, fname)
-    print(f"Meta information generated for Composite nodes. Time taken: {time.time() - start_time:.2f} seconds")
-
-    # Generate summaries
-    start_time = time.time()
-    print("Generating text summaries...")
-    text_summaries, table_summaries = await generate_text_summaries(texts, tables)
-    print(f"Text summaries generated. Time taken: {time.time() - start_time:.2f} seconds")
 
+async def lookup_answer(query, version, scope=None):
+    """
+    Cached result for an exact or near-duplicate query on this corpus version, or None.
+    Also returns the query embedding when one was computed; it is cached, so retrieval does not embed the query again.
+    """
+    result = answer_cache.get(query, version, scope)
+    if result is not None:
+        return result, None
+    query_embedding = await Config.vectorstore.embeddings.aembed_query(query)
+    return answer_cache.get_similar(query_embedding, version, scope), query_embedding
+
+async def query_vectorstore(query, filenames=None):
+    """filenames: optional id_filenames to answer from, instead of the whole corpus"""
     start_time = time.time()
-    print("Generating image summaries...")
-    img_base64_list, image_summaries, image_info = await generate_img_summaries("figures", img_nodes_info)
-    print(f"Image summaries generated. Time taken: {time.time() - start_time:.2f} seconds")
-
-    # delete the figures
-    figures_dir = "figures"
-    for file_name in os.listdir(figures_dir):
-        file_path = os.path.join(figures_dir, file_name)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
-    print("All files in the 'figures' directory have been deleted.")
-
-    start_time = time.time()
-    img_nodes_info = process_image_summaries(image_summaries, img_base64_list, image_info, meta_node_info, fname)
-    print(f"Meta information generated for Image nodes. Time taken: {time.time() - start_time:.2f} seconds")
-
-    # Create or load retriever
-    start_time = time.time()
-    print("Creating or loading multi-vector retriever...")
-    vectorstore = Config.vectorstore
-    retriever = create_or_update_multi_vector_retriever(
-        vectorstore,
-        text_summaries,
-        texts,
-        table_summaries,
-        tables,
-        image_summaries,
-        img_base64_list,
-        meta_node_info,
-        img_nodes_info,
-        DOCSTORE_PATH='./docstore.pkl'
-    )
-    print(f"Multi-vector retriever created. Time taken: {time.time() - start_time:.2f} seconds")
-
-
-    # return retriever
-
-async def query_vectorstore(query):
-    
-    start_time = time.time()
-    print("Loading vector store...")
-    vectorstore = Config.vectorstore
-    docstore = load_in_memory_store('./docstore.pkl')
-
-    # Create the retriever
-    retriever = MultiVectorRetriever(
-        vectorstore=vectorstore,
-        docstore=docstore,
-        id_key="doc_id",
-    )
-    print(f"Vector store loaded. Time taken: {time.time() - start_time:.2f} seconds")
-
-    # Create RAG chain
-    start_time = time.time()
-    print("Creating RAG chain with reranking...")
-    chain = multi_modal_rag_chain_with_reranking(retriever)
-    print(f"RAG chain created. Time taken: {time.time() - start_time:.2f} seconds")
+    print("Loading RAG chain...")
+    service = get_retriever_service()
+    chain = service.get_chain()
+    print(f"RAG chain loaded. Time taken: {time.time() - start_time:.2f} seconds")
 
     # Run query
     start_time = time.time()
     print(f"Running query: {query}")
-    result = chain(query)
+    version = await asyncio.to_thread(service.corpus_version)
+    scope = AnswerCache.scope(filenames)
+    with stage("answer_cache_lookup"):
+        result, query_embedding = await lookup_answer(query, version, scope)
+    if result is None:
+        result = await chain(query, filenames)
+        answer_cache.set(query, query_embedding, result, version, scope)
     print(f"Query result obtained. Time taken: {time.time() - start_time:.2f} seconds")
+    print(f"Embedding cache: {Config.vectorstore.embeddings.stats()}")
+    print(f"Answer cache: {answer_cache.stats()}")
     # print(result['result'])
 
     return result
 
+async def query_vectorstore_batch(queries, filenames=None):
+    """
+    Answer many queries, yielding {"index", "query", "result"} (or "error") dicts as each one completes.
+    Repeated queries are answered once, cached answers are returned first, and the remaining
+    queries share one embedding request, one vector search and one docstore read.
+    """
+    start_time = time.time()
+    service = get_retriever_service()
+    chain = service.get_batch_chain()
+    version = await asyncio.to_thread(service.corpus_version)
+    scope = AnswerCache.scope(filenames)
+    print(f"Running batch of {len(queries)} queries")
+
+    # Indices of every distinct query, keyed like the answer cache
+    indices = {}
+    for index, query in enumerate(queries):
+        indices.setdefault(AnswerCache.key(query, scope), []).append(index)
+
+    def results_for(key, result=None, error=None):
+        for index in indices[key]:
+            if error is not None:
+                yield {"index": index, "query": queries[index], "error": error}
+            else:
+                yield {"index": index, "query": queries[index], "result": result}
+
+    pending = []
+    for key, same in indices.items():
+        result = answer_cache.get(queries[same[0]], version, scope)
+        if result is not None:
+            for item in results_for(key, result):
+                yield item
+        else:
+            pending.append(key)
+
+    misses = []
+    if pending:
+        query_embeddings = await Config.vectorstore.embeddings.aembed_documents([queries[indices[key][0]] for key in pending])
+        for key, query_embedding in zip(pending, query_embeddings):
+            result = answer_cache.get_similar(query_embedding, version, scope)
+            if result is not None:
+                for item in results_for(key, result):
+                    yield item
+            else:
+                misses.append((key, query_embedding))
+
+    if misses:
+        miss_queries = [queries[indices[key][0]] for key, _ in misses]
+        async for i, result in chain(miss_queries, [query_embedding for _, query_embedding in misses], filenames):
+            key, query_embedding = misses[i]
+            if isinstance(result, Exception):
+                for item in results_for(key, error=str(result)):
+                    yield item
+            else:
+                answer_cache.set(miss_queries[i], query_embedding, result, version, scope)
+                for item in results_for(key, result):
+                    yield item
+
+    elapsed = time.time() - start_time
+    print(f"Batch of {len(queries)} queries ({len(misses)} generated) finished. Time taken: {elapsed:.2f} seconds")
+    print(f"Embedding cache: {Config.vectorstore.embeddings.stats()}")
+    print(f"Answer cache: {answer_cache.stats()}")
+
+async def stream_query_vectorstore(query, filenames=None):
+    """
+    Streaming counterpart of query_vectorstore, yielding (event, data) pairs:
+    "metadata" with the ranked source metadata, "token" per answer chunk, and a final "done" with timings.
+    Time to the first event and to the first answer token are reported separately from the total latency.
+    A cached answer is sent as a single token event.
+    """
+    start_time = time.time()
+    service = get_retriever_service()
+    chain = service.get_stream_chain()
+    print(f"Running streaming query: {query}")
+    version = await asyncio.to_thread(service.corpus_version)
+    scope = AnswerCache.scope(filenames)
+    with stage("answer_cache_lookup"):
+        result, query_embedding = await lookup_answer(query, version, scope)
+    events = _replay(result) if result is not None else chain(query, filenames)
+
+    timings = {"cached": result is not None}
+    metadata, tokens = None, []
+    async for event, data in events:
+        if event == "metadata":
+            metadata = data
+            timings["metadata_seconds"] = round(time.time() - start_time, 3)
+        else:
+            tokens.append(data)
+            if "first_token_seconds" not in timings:
+                timings["first_token_seconds"] = round(time.time() - start_time, 3)
+        yield event, data
+    if result is None:
+        answer_cache.set(query, query_embedding, {"result": "".join(tokens), "metadata": metadata}, version, scope)
+    timings["total_seconds"] = round(time.time() - start_time, 3)
+    print(f"Streaming query finished. Sources after {timings['metadata_seconds']:.2f} seconds, "
+          f"first token after {timings.get('first_token_seconds', timings['total_seconds']):.2f} seconds, "
+          f"total {timings['total_seconds']:.2f} seconds")
+    print(f"Answer cache: {answer_cache.stats()}")
+    yield "done", timings
+
+async def _replay(result):
+    yield "metadata", result["metadata"]
+    yield "token", result["result"]
+
 if __name__ == "__main__":
     fpath = "/Users/ashwithrambasani/GenAI/micro1/data/"
     fname = "llama3.1_blog.pdf"
     query = "How does Llama3.1 compare against gpt-4o and Claude 3.5 Sonnet in human evals?"
 
     # Process new PDF and save to vector store
+    from src.ingest import process_new_pdf
     asyncio.run(process_new_pdf(fpath, fname))
 
     # Query the vector store
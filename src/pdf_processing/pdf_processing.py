@@ -1,21 +1,113 @@
-from unstructured.partition.pdf import partition_pdf
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from src.config import Config
+import base64
+import collections
+import multiprocessing
 import os
+import tempfile
 
-def extract_pdf_elements(path, fname):
+# unstructured (with the hi_res layout models) and pypdf are imported by the functions that partition,
+# so the rest of this module, and the offline benchmarks with their fake partitioner, run without them
+
+_partition_pools = {}
+
+def get_partition_pool(workers):
+    if workers not in _partition_pools:
+        # Workers keep the layout model loaded between PDFs; spawn avoids forking the threaded API process
+        _partition_pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _partition_pools[workers]
+
+def discard_partition_pool(workers, pool):
+    """Drop a pool whose worker died (e.g. out of memory), so later PDFs get a new one rather than BrokenProcessPool"""
+    if _partition_pools.get(workers) is pool:
+        del _partition_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _partition_page_range(chunk_path, fname, starting_page_number):
+    # Chunking is left to the parent so sections can span page ranges
+    from unstructured.partition.pdf import partition_pdf
     return partition_pdf(
-        filename=path + fname,
+        filename=chunk_path,
+        metadata_filename=fname,
+        starting_page_number=starting_page_number,
         extract_images_in_pdf=True,
+        extract_image_block_to_payload=True,
         infer_table_structure=True,
-        max_characters=4000,
-        new_after_n_chars=3800,
-        combine_text_under_n_chars=2000,
-        image_output_dir_path=path,
         strategy='hi_res',
-        chunking_strategy="by_title",
         include_metadata=True,
         additional_partition_args={"coordinates": True},
     )
 
+def split_pdf(pdf_path, output_dir, pages_per_task):
+    """Write page ranges of pdf_path to output_dir, returning (chunk_path, starting_page_number) pairs"""
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(pdf_path)
+    chunks = []
+    for start in range(0, len(reader.pages), pages_per_task):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + pages_per_task]:
+            writer.add_page(page)
+        chunk_path = os.path.join(output_dir, f"pages-{start + 1:05d}.pdf")
+        with open(chunk_path, "wb") as f:
+            writer.write(f)
+        chunks.append((chunk_path, start + 1))
+    return chunks
+
+def _chunk_elements(elements):
+    from unstructured.chunking.title import chunk_by_title
+    from unstructured.documents.elements import assign_and_map_hash_ids
+    chunked = chunk_by_title(
+        elements,
+        max_characters=4000,
+        new_after_n_chars=3800,
+        combine_text_under_n_chars=2000,
+    )
+    return assign_and_map_hash_ids(chunked)
+
+def iter_pdf_element_batches(path, fname, workers=None, pages_per_task=None):
+    """
+    Partition a PDF range by range, yielding by_title chunks in page order as soon as each page range is done,
+    so summarizing and indexing can start before the whole file is partitioned.
+    Elements after the last title of a range are held back for the next one, as their section may continue there.
+    At most 2 * workers ranges are partitioned ahead of the consumer.
+    """
+    workers = workers or Config.PARTITION_WORKERS
+    pages_per_task = pages_per_task or Config.PARTITION_PAGES_PER_TASK
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        chunks = split_pdf(path + fname, tmp_dir, pages_per_task)
+        if workers > 1:
+            ranges = _partitioned_in_pool(workers, chunks, fname, 2 * workers)
+        else:
+            ranges = (_partition_page_range(chunk_path, fname, start) for chunk_path, start in chunks)
+
+        carried = []
+        for elements in ranges:
+            elements = carried + elements
+            titles = [i for i, element in enumerate(elements) if 'Title' in str(type(element))]
+            # A range without a title of its own flushes the held-back section rather than growing it
+            cut = titles[-1] if titles and titles[-1] >= len(carried) else len(elements)
+            settled, carried = elements[:cut], elements[cut:]
+            if settled:
+                yield _chunk_elements(settled)
+        if carried:
+            yield _chunk_elements(carried)
+
+def _partitioned_in_pool(workers, chunks, fname, ahead):
+    pool = get_partition_pool(workers)
+    pending = collections.deque()
+    try:
+        for chunk_path, starting_page_number in chunks:
+            pending.append(pool.submit(_partition_page_range, chunk_path, fname, starting_page_number))
+            if len(pending) >= ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        # Only the PDF being partitioned fails; the next one is partitioned in a new pool
+        discard_partition_pool(workers, pool)
+        raise
+
 def categorize_elements(raw_pdf_elements):
     table_texts = []
     composite_texts = []
@@ -26,6 +118,22 @@ def categorize_elements(raw_pdf_elements):
             composite_texts.append({element.id: str(element)})
     return composite_texts, table_texts
 
+def image_element_name(element):
+    return f"figure-{element.metadata.page_number}-{element.id}.jpg"
+
+def extract_images(raw_pdf_elements):
+    """
+    Image payloads extracted in memory by partition_pdf, keyed by image name.
+    Nothing is written to disk, so concurrent ingests can't see each other's images.
+    """
+    images = {}
+    for element in raw_pdf_elements:
+        if 'CompositeElement' in str(type(element)):
+            for sube in element.metadata.orig_elements:
+                if 'Image' in str(type(sube)) and sube.metadata.image_base64:
+                    images[image_element_name(sube)] = base64.b64decode(sube.metadata.image_base64)
+    return images
+
 def convert_points_to_bbox(tups):
     x1, x2 = min([tup[0] for tup in tups]), max([tup[0] for tup in tups])
     y1, y2 = min([tup[1] for tup in tups]), max([tup[1] for tup in tups])
@@ -53,9 +161,8 @@ def generate_meta_info(raw_pdf_elements, fname):
             for sube in element.metadata.orig_elements:
                 if 'Image' in str(type(sube)):
                     img_dict = sube.metadata.to_dict()
-                    image_name = img_dict['image_path'].rsplit('/', 1)[-1]
-                    image_path = img_dict['image_path']
-                    file_size_kb = os.path.getsize(image_path) / 1024
+                    image_name = image_element_name(sube)
+                    file_size_kb = len(base64.b64decode(img_dict.get('image_base64', ''))) / 1024
                     img_nodes_info[image_name] = img_dict['coordinates']['points'], fname, sube.id, file_size_kb
                     meta_node_info[sube.id] = [
                         {
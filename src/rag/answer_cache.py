@@ -0,0 +1,99 @@
+import collections
+import hashlib
+import threading
+import numpy as np
+from src.utils.cache import normalize_query, hit_stats
+from src.config import Config
+
+
+class AnswerCache:
+    """
+    LRU cache of query results for one corpus version.
+    Exact repeats match on the hash of the normalized query, near-duplicates on the cosine similarity
+    of their query embeddings. All entries are dropped when the corpus version changes.
+    Queries scoped to a set of documents only match queries with the same scope.
+    similarity_threshold: minimum cosine similarity for a near-duplicate hit, above 1 disables them
+    """
+
+    def __init__(self, maxsize, similarity_threshold):
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        # key -> (unit query vector or None, result, scope)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope(filenames=None):
+        return "\0".join(sorted(set(filenames))) if filenames else None
+
+    @staticmethod
+    def key(query, scope=None):
+        return hashlib.sha256(f"{scope or ''}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _unit(query_embedding):
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _check_version(self, version):
+        """Drop everything cached for an older corpus; False if version itself is outdated"""
+        if self.version is None or version > self.version:
+            self._entries.clear()
+            self.version = version
+        return version == self.version
+
+    def get(self, query, version, scope=None):
+        """Exact match only, so a hit needs no embedding call"""
+        with self._lock:
+            key = self.key(query, scope)
+            if self._check_version(version) and key in self._entries:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key][1]
+            return None
+
+    def get_similar(self, query_embedding, version, scope=None):
+        with self._lock:
+            candidates = [
+                (key, vector) for key, (vector, _, entry_scope) in self._entries.items()
+                if vector is not None and entry_scope == scope
+            ]
+            if not self._check_version(version) or not candidates or self.similarity_threshold > 1:
+                self.misses += 1
+                return None
+            scores = np.stack([vector for _, vector in candidates]) @ self._unit(query_embedding)
+            best = int(scores.argmax())
+            if scores[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            key = candidates[best][0]
+            self._entries.move_to_end(key)
+            self.similar_hits += 1
+            return self._entries[key][1]
+
+    def set(self, query, query_embedding, result, version, scope=None):
+        with self._lock:
+            # A result generated before an ingest finished is not stored for the new corpus
+            if not self._check_version(version):
+                return
+            vector = self._unit(query_embedding) if query_embedding is not None else None
+            key = self.key(query, scope)
+            self._entries[key] = (vector, result, scope)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return hit_stats(
+                self.exact_hits + self.similar_hits, self.misses, exact_hits=self.exact_hits,
+                similar_hits=self.similar_hits, size=len(self._entries), version=self.version,
+            )
+
+
+answer_cache = AnswerCache(Config.ANSWER_CACHE_SIZE, Config.ANSWER_CACHE_SIMILARITY)
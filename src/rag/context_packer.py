@@ -0,0 +1,55 @@
+import tiktoken
+from src.vector_store.docstore import is_inline_image
+from src.config import Config
+
+# Prompt tokens of one 1300x600 image at high detail (85 base + 170 per 512px tile, 8 tiles)
+IMAGE_PROMPT_TOKENS = 1445
+
+_encodings = {}
+
+def get_encoding(model="gpt-4o-mini"):
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+
+def is_image_source(source):
+    return 'image_ref' in source or is_inline_image(source)
+
+def pack_context(ranked_sources, token_budget=None, max_images=None, min_truncated_tokens=None, model="gpt-4o-mini"):
+    """
+    Choose the sources that go into the generation prompt, in rerank order, within a token and image budget.
+    A text that does not fit is truncated to the remaining budget if at least min_truncated_tokens remain,
+    otherwise it is dropped; lower-ranked sources may still fill the budget that is left.
+    Returns the packed sources and their indices in ranked_sources.
+    """
+    remaining = token_budget or Config.CONTEXT_TOKEN_BUDGET
+    max_images = Config.CONTEXT_MAX_IMAGES if max_images is None else max_images
+    min_truncated_tokens = min_truncated_tokens or Config.CONTEXT_MIN_TRUNCATED_TOKENS
+    encoding = get_encoding(model)
+
+    packed_sources = []
+    packed = []
+    images = 0
+    for i, source in enumerate(ranked_sources):
+        if is_image_source(source):
+            if images < max_images and remaining >= IMAGE_PROMPT_TOKENS:
+                images += 1
+                remaining -= IMAGE_PROMPT_TOKENS
+                packed_sources.append(source)
+                packed.append(i)
+            continue
+
+        tokens = encoding.encode(source.get('content') or "", disallowed_special=())
+        if len(tokens) <= remaining:
+            remaining -= len(tokens)
+            packed_sources.append(source)
+            packed.append(i)
+        elif remaining >= min_truncated_tokens:
+            packed_sources.append(dict(source, content=encoding.decode(tokens[:remaining])))
+            packed.append(i)
+            remaining = 0
+    return packed_sources, packed
@@ -1,36 +1,54 @@
-from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
-from src.utils.image_utils import looks_like_base64, is_image_data, resize_base64_image
-from src.rag.rerank import re_rank_sources
+from src.llm.scheduler import llm_scheduler, get_chat_model, INTERACTIVE, BACKGROUND
+from src.utils.image_utils import looks_like_base64, is_image_data, resize_base64_image, resize_image_bytes
+from src.rag.rerank import re_rank_sources, image_summary_cache
+from src.rag.context_packer import pack_context
 from langchain_core.documents import Document
-from langchain_core.output_parsers import StrOutputParser
-import os
+from src.vector_store.blob_store import PROMPT_IMAGE_SIZE
+from src.telemetry.tracing import stage
+from src.config import Config
+import asyncio
 
 def split_image_text_types(docs):
     b64_images = []
+    image_types = []
     texts = []
     for doc in docs:
         if isinstance(doc, Document):
             doc = doc.page_content
+        if isinstance(doc, dict) and 'image_ref' in doc:
+            prompt_variant = doc.get('variants', {}).get('prompt')
+            if prompt_variant:
+                # The prompt-ready copy was made at ingest, so the image is only read, never decoded
+                b64_images.append(Config.image_store.get_base64(prompt_variant['ref']))
+                image_types.append(prompt_variant['content_type'])
+            else:
+                b64_images.append(resize_image_bytes(Config.image_store.get(doc['image_ref']), size=PROMPT_IMAGE_SIZE))
+                image_types.append("image/jpeg")
+            continue
+        if isinstance(doc, dict) and 'content_type' in doc:
+            texts.append(doc['content'])
+            continue
         if isinstance(doc, dict):
             doc = list(doc.values())[0]
         if looks_like_base64(doc) and is_image_data(doc):
-            doc = resize_base64_image(doc, size=(1300, 600))
+            doc = resize_base64_image(doc, size=PROMPT_IMAGE_SIZE)
             b64_images.append(doc)
+            image_types.append("image/jpeg")
         else:
             texts.append(doc)
-    return {"images": b64_images, "texts": texts}
+    return {"images": b64_images, "image_types": image_types, "texts": texts}
 
 def img_prompt_func(data_dict):
     formatted_texts = "\n".join(data_dict["context"]["texts"])
     messages = []
 
     if data_dict["context"]["images"]:
-        for image in data_dict["context"]["images"]:
+        image_types = data_dict["context"].get("image_types") or ["image/jpeg"] * len(data_dict["context"]["images"])
+        for image, image_type in zip(data_dict["context"]["images"], image_types):
             image_message = {
                 "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image}"},
+                "image_url": {"url": f"data:{image_type};base64,{image}"},
             }
             messages.append(image_message)
 
@@ -48,24 +66,207 @@ def img_prompt_func(data_dict):
     messages.append(text_message)
     return [HumanMessage(content=messages)]
 
-def multi_modal_rag_chain_with_reranking(retriever):
-    model = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1024, openai_api_key=os.getenv("OPENAI_API_KEY"))
+def _hit_ids(retriever, hits):
+    """Unique doc_ids of the retrieved (summary, metadata) hits in rank order, with the summary each was found under"""
+    doc_ids = []
+    summaries = {}
+    for summary, metadata in hits:
+        doc_id = (metadata or {}).get(retriever.id_key)
+        if doc_id and doc_id not in summaries:
+            doc_ids.append(doc_id)
+            summaries[doc_id] = summary
+    return doc_ids, summaries
 
-    def chain_with_sources(query):
-        sources = retriever.invoke(query)
-        ranked_sources, ranked_metadata = re_rank_sources(sources, query)
+def reciprocal_rank_fusion(rankings, k=None):
+    """Merge ranked doc_id lists; every list adds 1 / (k + rank) to the score of each doc_id it contains"""
+    k = k or Config.RRF_K
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0) + 1 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
 
-        chain = (
-            {
-                "context": RunnableLambda(lambda _: ranked_sources) | RunnableLambda(split_image_text_types),
-                "question": RunnableLambda(lambda _: query),
-            }
-            | RunnableLambda(img_prompt_func)
-            | model
-            | StrOutputParser()
+def search_kwargs_for(retriever, filenames=None):
+    """retriever.search_kwargs, restricted to the summaries of the given id_filenames if any"""
+    if not filenames:
+        return retriever.search_kwargs
+    return dict(retriever.search_kwargs, filter={"filename": {"$in": list(filenames)}})
+
+def fuse_lexical_hits(retriever, queries, hits, filenames=None):
+    """
+    Merge the BM25 hits of every query into its vector hits by reciprocal-rank fusion, keeping the top k.
+    hits: a (doc_ids, summaries) pair per query, as returned by _hit_ids
+    filenames: optional id_filenames the BM25 hits are restricted to
+    Summaries of hits that only BM25 found are read from the vectorstore in one call.
+    """
+    if not Config.HYBRID_RETRIEVAL:
+        return hits
+    k = retriever.search_kwargs.get("k", 4)
+    fused = []
+    for query, (doc_ids, summaries) in zip(queries, hits):
+        lexical_ids = [doc_id for doc_id, _ in Config.bm25_index.search(query, k, documents=filenames)]
+        fused.append((reciprocal_rank_fusion([doc_ids, lexical_ids])[:k], summaries))
+
+    missing = list({doc_id for doc_ids, summaries in fused for doc_id in doc_ids if doc_id not in summaries})
+    found = {}
+    if missing:
+        stored = retriever.vectorstore.get(where={retriever.id_key: {"$in": missing}}, include=["documents", "metadatas"])
+        found = {metadata[retriever.id_key]: summary for summary, metadata in zip(stored["documents"], stored["metadatas"])}
+    return [
+        ([doc_id for doc_id in doc_ids if doc_id in summaries or doc_id in found], {**found, **summaries})
+        for doc_ids, summaries in fused
+    ]
+
+async def retrieve_sources(retriever, query, filenames=None):
+    """
+    Same lookup as MultiVectorRetriever, merged with BM25 hits when Config.HYBRID_RETRIEVAL is set.
+    Every source also keeps its doc_id and the summary it was indexed under, and the query embedding
+    is returned so the reranker can reuse both.
+    filenames: optional id_filenames to search, instead of the whole corpus
+    """
+    query_embedding = await retriever.vectorstore.embeddings.aembed_query(query)
+    search_kwargs = search_kwargs_for(retriever, filenames)
+    with stage("vector_search"):
+        # Queried like the batch path: a hit another worker process has just deleted comes back without
+        # metadata and is skipped, where building Documents from it would raise
+        results = await asyncio.to_thread(
+            retriever.vectorstore._collection.query,
+            query_embeddings=[query_embedding],
+            n_results=search_kwargs.get("k", 4),
+            where=search_kwargs.get("filter"),
+            include=["documents", "metadatas"],
+        )
+    hits = [_hit_ids(retriever, zip(results["documents"][0], results["metadatas"][0]))]
+    with stage("lexical_search"):
+        [(doc_ids, summaries)] = await asyncio.to_thread(fuse_lexical_hits, retriever, [query], hits, filenames)
+    values = await retriever.docstore.amget(doc_ids)
+    sources = [
+        dict(value, doc_id=doc_id, summary=summaries[doc_id])
+        for doc_id, value in zip(doc_ids, values) if value is not None
+    ]
+    return sources, query_embedding
+
+async def retrieve_sources_batch(retriever, queries, query_embeddings=None, filenames=None):
+    """
+    retrieve_sources for many queries at once: one embedding request, one vector search
+    for all query embeddings, and one docstore read for the union of the retrieved doc_ids.
+    Returns a (sources, query_embedding) pair per query.
+    """
+    if not queries:
+        return []
+    if query_embeddings is None:
+        query_embeddings = await retriever.vectorstore.embeddings.aembed_documents(queries)
+    search_kwargs = search_kwargs_for(retriever, filenames)
+    with stage("vector_search", queries=len(queries)):
+        results = await asyncio.to_thread(
+            retriever.vectorstore._collection.query,
+            query_embeddings=query_embeddings,
+            n_results=search_kwargs.get("k", 4),
+            where=search_kwargs.get("filter"),
+            include=["documents", "metadatas"],
+        )
+    hits = [
+        _hit_ids(retriever, zip(documents, metadatas))
+        for documents, metadatas in zip(results["documents"], results["metadatas"])
+    ]
+    with stage("lexical_search", queries=len(queries)):
+        hits = await asyncio.to_thread(fuse_lexical_hits, retriever, queries, hits, filenames)
+    unique_ids = list(dict.fromkeys(doc_id for doc_ids, _ in hits for doc_id in doc_ids))
+    values = dict(zip(unique_ids, await retriever.docstore.amget(unique_ids)))
+    return [
+        (
+            [dict(values[doc_id], doc_id=doc_id, summary=summaries[doc_id]) for doc_id in doc_ids if values[doc_id] is not None],
+            query_embedding,
         )
+        for (doc_ids, summaries), query_embedding in zip(hits, query_embeddings)
+    ]
+
+async def prompt_from_sources(sources, query, query_embedding=None):
+    """Rerank and pack the retrieved sources, returning the prompt messages and the metadata of the packed sources"""
+    with stage("rerank", sources=len(sources)):
+        ranked_sources, ranked_metadata = await re_rank_sources(sources, query, query_embedding)
+    print(f"Image re-summary cache: {image_summary_cache.stats()}")
+
+    # Only what fits the token and image budget goes into the prompt, and only its metadata is returned
+    with stage("pack_context"):
+        packed_sources, packed = await asyncio.to_thread(pack_context, ranked_sources)
+    print(f"Packed {len(packed)} of {len(ranked_sources)} sources into the prompt")
+
+    # Building the context reads image files, so it runs off the event loop
+    context = await asyncio.to_thread(split_image_text_types, packed_sources)
+    messages = img_prompt_func({"context": context, "question": query})
+    return messages, [ranked_metadata[i] for i in packed]
+
+async def build_prompt(retriever, query, filenames=None):
+    """Retrieve, rerank and pack sources for the query, returning the prompt messages and the packed source metadata"""
+    sources, query_embedding = await retrieve_sources(retriever, query, filenames)
+    return await prompt_from_sources(sources, query, query_embedding)
+
+def multi_modal_rag_chain_with_reranking(retriever, model=None):
+    if model is None:
+        model = get_chat_model("gpt-4o-mini", temperature=0, max_tokens=1024)
+
+    async def chain_with_sources(query, filenames=None):
+        messages, ranked_metadata = await build_prompt(retriever, query, filenames)
+        with stage("generation"):
+            response = await llm_scheduler.ainvoke(model, messages, priority=INTERACTIVE)
+        return {"result": response.content, "metadata": ranked_metadata}
+
+    return chain_with_sources
+
+def multi_modal_rag_stream_with_reranking(retriever, model=None):
+    """
+    Streaming variant of multi_modal_rag_chain_with_reranking.
+    Yields ("metadata", ranked_metadata) as soon as the sources are ranked, then ("token", text) per answer chunk.
+    """
+    if model is None:
+        model = get_chat_model("gpt-4o-mini", temperature=0, max_tokens=1024)
+
+    async def stream_with_sources(query, filenames=None):
+        messages, ranked_metadata = await build_prompt(retriever, query, filenames)
+        yield "metadata", ranked_metadata
+        with stage("generation", stream=True):
+            async for chunk in llm_scheduler.astream(model, messages, priority=INTERACTIVE):
+                if chunk.content:
+                    yield "token", chunk.content
+
+    return stream_with_sources
+
+def multi_modal_rag_batch_with_reranking(retriever, model=None, max_concurrency=None):
+    """
+    Batch variant of multi_modal_rag_chain_with_reranking for offline runs over many queries.
+    Retrieval is shared across the batch (see retrieve_sources_batch), then reranking and generation
+    run concurrently, at most max_concurrency at a time.
+    Yields (index, result) as each query completes, with the exception as result if that query failed.
+    """
+    if model is None:
+        model = get_chat_model("gpt-4o-mini", temperature=0, max_tokens=1024)
+
+    async def batch_with_sources(queries, query_embeddings=None, filenames=None):
+        retrieved = await retrieve_sources_batch(retriever, queries, query_embeddings, filenames)
+        semaphore = asyncio.Semaphore(max_concurrency or Config.BATCH_QUERY_CONCURRENCY)
+
+        async def answer(index, query, sources, query_embedding):
+            async with semaphore:
+                try:
+                    messages, ranked_metadata = await prompt_from_sources(sources, query, query_embedding)
+                    # Batch answers yield to interactive queries like ingest work does
+                    with stage("generation", batch=True):
+                        response = await llm_scheduler.ainvoke(model, messages, priority=BACKGROUND)
+                    return index, {"result": response.content, "metadata": ranked_metadata}
+                except Exception as e:
+                    return index, e
 
-        result = chain.invoke({"context": ranked_sources, "question": query})
-        return {"result": result, "metadata": ranked_metadata}
+        tasks = [
+            asyncio.create_task(answer(index, query, sources, query_embedding))
+            for index, (query, (sources, query_embedding)) in enumerate(zip(queries, retrieved))
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # A client that stops reading cancels the queries still running
+            for task in tasks:
+                task.cancel()
 
-    return chain_with_sources
\ No newline at end of file
+    return batch_with_sources
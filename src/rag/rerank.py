@@ -1,48 +1,177 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
-from src.utils.image_utils import looks_like_base64, is_image_data
-import os
-
-def re_rank_sources(sources, query):
-    def get_image_summary(image_data, query):
-        prompt = f"Provide an image summary for the image attached which could answer the query: '{query}'."
-        chat = ChatOpenAI(model="gpt-4o-mini", max_tokens=1024, openai_api_key=os.getenv("OPENAI_API_KEY"))
-        msg = chat.invoke(
+from src.llm.scheduler import llm_scheduler, get_chat_model, INTERACTIVE
+from src.utils.cache import LRUTTLCache, normalize_query
+from src.vector_store.blob_store import image_key
+from src.vector_store.docstore import is_inline_image
+from src.config import Config
+import numpy as np
+import asyncio
+
+# Per-query image summaries keyed on (image hash, normalized query)
+image_summary_cache = LRUTTLCache(maxsize=Config.RERANK_CACHE_SIZE, ttl=Config.RERANK_CACHE_TTL)
+
+
+class Reranker:
+    """
+    Scores candidate sources against a query, higher is better.
+    Rerankers with uses_text=True score the text of every source, so retrieved images
+    are first turned into text (see Config.RERANK_IMAGE_MODE).
+    """
+    uses_text = True
+
+    def score(self, query, query_embedding, sources, texts):
+        raise NotImplementedError
+
+
+class EmbeddingReranker(Reranker):
+    """Cosine similarity between the query embedding and the summary embeddings already stored in the vectorstore."""
+    uses_text = False
+
+    def __init__(self, vectorstore, id_key="doc_id"):
+        self.vectorstore = vectorstore
+        self.id_key = id_key
+
+    def score(self, query, query_embedding, sources, texts):
+        if query_embedding is None:
+            query_embedding = self.vectorstore.embeddings.embed_query(query)
+        doc_ids = [source.get(self.id_key) for source in sources]
+        stored = self.vectorstore.get(
+            where={self.id_key: {"$in": [doc_id for doc_id in doc_ids if doc_id]}},
+            include=["embeddings", "metadatas"],
+        )
+        vectors = {
+            metadata[self.id_key]: embedding
+            for metadata, embedding in zip(stored["metadatas"], stored["embeddings"])
+        }
+
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        matrix = np.zeros((len(sources), query_vector.shape[0]), dtype=np.float32)
+        for i, doc_id in enumerate(doc_ids):
+            if doc_id in vectors:
+                matrix[i] = vectors[doc_id]
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector)
+        # Sources without a stored vector keep a norm of 0 and score 0
+        return np.divide(matrix @ query_vector, norms, out=np.zeros(len(sources), dtype=np.float32), where=norms > 0)
+
+
+class TfidfReranker(Reranker):
+    """TF-IDF fitted on the query and the candidate texts."""
+
+    def score(self, query, query_embedding, sources, texts):
+        # sklearn takes seconds to import, so only deployments that use this reranker pay for it
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.metrics.pairwise import cosine_similarity
+        vectorizer = TfidfVectorizer()
+        tfidf_matrix = vectorizer.fit_transform([query] + texts)
+        return cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
+
+
+class CrossEncoderReranker(Reranker):
+    """Local cross-encoder that scores every (query, text) pair in one batch."""
+
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        import torch
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        self.model.eval()
+
+    def score(self, query, query_embedding, sources, texts):
+        features = self.tokenizer([query] * len(texts), texts, padding=True, truncation=True, return_tensors="pt")
+        with self._torch.no_grad():
+            logits = self.model(**features).logits
+        return logits[:, 0].numpy()
+
+
+RERANKERS = {
+    "embedding": lambda: EmbeddingReranker(Config.vectorstore),
+    "tfidf": TfidfReranker,
+    "cross_encoder": CrossEncoderReranker,
+}
+
+_rerankers = {}
+
+def get_reranker(name=None):
+    name = name or Config.RERANKER
+    if name not in _rerankers:
+        _rerankers[name] = RERANKERS[name]()
+    return _rerankers[name]
+
+
+async def get_image_summary(image_hash, load_image, query, semaphore):
+    """load_image: returns the image as a data URL, only called on a cache miss"""
+    cache_key = (image_hash, normalize_query(query))
+    summary = image_summary_cache.get(cache_key)
+    if summary is not None:
+        return summary
+
+    prompt = f"Provide an image summary for the image attached which could answer the query: '{query}'."
+    async with semaphore:
+        msg = await llm_scheduler.ainvoke(
+            get_chat_model("gpt-4o-mini", max_tokens=1024),
             [
                 HumanMessage(
                     content=[
                         {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}},
+                        {"type": "image_url", "image_url": {"url": load_image()}},
                     ]
                 )
-            ]
+            ],
+            priority=INTERACTIVE,
         )
-        return msg.content
-
-    source_summary_dict = {}
-    processed_source_contents = []
-    source_metadata = []
-    for source in sources:
-        source_content = source['content']
-        source_meta = source['metadata']
-        if looks_like_base64(source_content) and is_image_data(source_content):
-            image_summary = get_image_summary(source_content, query)
-            processed_source_contents.append(image_summary)
-            source_summary_dict[image_summary] = source_content
-            source_metadata.append(source_meta)
+    image_summary_cache.set(cache_key, msg.content)
+    return msg.content
+
+async def source_texts(sources, query, image_mode=None):
+    """
+    Text used to rerank every source.
+    image_mode: "vision" re-summarizes every image for the query with gpt-4o-mini,
+    "summary" reuses the ingest-time image summary that was retrieved from the vectorstore.
+    """
+    image_mode = image_mode or Config.RERANK_IMAGE_MODE
+    semaphore = asyncio.Semaphore(Config.RERANK_MAX_CONCURRENCY)
+
+    processed_source_contents = [None] * len(sources)
+    tasks = {}
+    for i, source in enumerate(sources):
+        if 'image_ref' in source:
+            image_hash = source['image_ref']
+            # The prompt-ready variant is smaller than the original; entries from before variants existed send the original
+            variant = source.get('variants', {}).get('prompt') or {'ref': image_hash, 'content_type': source.get('content_type', 'image/jpeg')}
+            load_image = lambda variant=variant: f"data:{variant['content_type']};base64,{Config.image_store.get_base64(variant['ref'])}"
+        elif is_inline_image(source):
+            image_hash = image_key(source['content'].encode("utf-8"))
+            load_image = lambda content=source['content']: f"data:image/jpeg;base64,{content}"
         else:
-            processed_source_contents.append(source_content)
-            source_metadata.append(source_meta)
+            processed_source_contents[i] = source['content']
+            continue
+
+        if image_mode == "summary" and source.get('summary'):
+            processed_source_contents[i] = source['summary']
+        else:
+            tasks[i] = get_image_summary(image_hash, load_image, query, semaphore)
+
+    # Image re-summaries run concurrently, bounded by the semaphore
+    for i, image_summary in zip(tasks.keys(), await asyncio.gather(*tasks.values())):
+        processed_source_contents[i] = image_summary
+    return processed_source_contents
+
+async def re_rank_sources(sources, query, query_embedding=None, reranker=None, image_mode=None):
+    """
+    Rerank retrieved sources against the query.
+    query_embedding: the embedding used for retrieval, reused by the embedding reranker
+    reranker: name of a strategy in RERANKERS, defaults to Config.RERANKER
+    """
+    if not sources:
+        return [], []
+    reranker = get_reranker(reranker)
 
-    vectorizer = TfidfVectorizer()
-    all_texts = [query] + processed_source_contents
-    tfidf_matrix = vectorizer.fit_transform(all_texts)
-    cosine_similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
+    texts = await source_texts(sources, query, image_mode) if reranker.uses_text else None
+    scores = await asyncio.to_thread(reranker.score, query, query_embedding, sources, texts)
 
-    ranked_indices = cosine_similarities.argsort()[::-1]
+    ranked_indices = np.asarray(scores).argsort()[::-1]
     ranked_sources = [sources[i] for i in ranked_indices]
-    ranked_metadata = [source_metadata[i] for i in ranked_indices]
+    ranked_metadata = [sources[i]['metadata'] for i in ranked_indices]
 
-    return ranked_sources, ranked_metadata
\ No newline at end of file
+    return ranked_sources, ranked_metadata
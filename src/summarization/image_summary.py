@@ -1,18 +1,16 @@
 import base64
-import os
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
-import asyncio
+from src.llm.scheduler import llm_scheduler, get_chat_model, BACKGROUND
+from src.vector_store.blob_store import image_key
+from src.summarization.summary_cache import cached_summaries
 
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+IMAGE_SUMMARY_MODEL = "gpt-4o-mini"
 
 async def async_image_summarize(img_base64, prompt):
     """Make image summary"""
-    chat = ChatOpenAI(model="gpt-4o-mini", max_tokens=1024, openai_api_key=os.getenv("OPENAI_API_KEY"))
+    chat = get_chat_model(IMAGE_SUMMARY_MODEL, max_tokens=1024)
 
-    msg = await asyncio.to_thread(chat.invoke, [
+    msg = await llm_scheduler.ainvoke(chat, [
         HumanMessage(
             content=[
                 {"type": "text", "text": prompt},
@@ -22,17 +20,20 @@ async def async_image_summarize(img_base64, prompt):
                 },
             ]
         )
-    ])
+    ], priority=BACKGROUND)
     return msg.content
 
-async def generate_img_summaries(path, img_nodes_info):
+async def generate_img_summaries(images, img_nodes_info):
     """
-    Generate summaries and base64 encoded strings for images
-    path: Path to list of .jpg files extracted by Unstructured
+    Generate summaries for images and return their raw bytes
+    images: Dict of image name to the image bytes extracted by Unstructured
     """
 
-    # Store base64 encoded images
-    img_base64_list = []
+    # Store raw image bytes; base64 is only produced for the summarization request
+    img_bytes_list = []
+
+    # Store the names of the images that were summarized
+    img_names = []
 
     # Store image summaries
     image_summaries = []
@@ -48,33 +49,35 @@ async def generate_img_summaries(path, img_nodes_info):
     names, and dates which could help in retrieval. """
 
     # Apply to images
-    tasks = []
-    for img_file in sorted(os.listdir(path)):
-        if img_file.endswith(".jpg"):
-            img_path = os.path.join(path, img_file)
-            if os.path.getsize(img_path) > 3 * 1024:  # Filter out files less than 3KB
-                base64_image = encode_image(img_path)
-                img_base64_list.append(base64_image)
-                tasks.append(async_image_summarize(base64_image, prompt))
-                image_info.append(img_nodes_info.get(img_file, None))
-
-    image_summaries = await asyncio.gather(*tasks)
+    for img_file, image_bytes in images.items():
+        if len(image_bytes) > 3 * 1024:  # Filter out images less than 3KB
+            img_bytes_list.append(image_bytes)
+            img_names.append(img_file)
+            image_info.append(img_nodes_info.get(img_file, None))
+
+    async def summarize(image_bytes):
+        return await async_image_summarize(base64.b64encode(image_bytes).decode("utf-8"), prompt)
+
+    image_summaries, hits = await cached_summaries(img_bytes_list, IMAGE_SUMMARY_MODEL, prompt, summarize)
+    print(f"Image summary cache hits: {hits}/{len(img_bytes_list)}")
 
     # Combine image filenames with their summaries
-    image_summaries = [{img_file: summary} for img_file, summary in zip(sorted(os.listdir(path)), image_summaries) if img_file.endswith(".jpg")]
+    image_summaries = [{img_file: summary} for img_file, summary in zip(img_names, image_summaries)]
 
-    return img_base64_list, image_summaries, image_info
+    return img_bytes_list, image_summaries, image_info
 
 
 
-def process_image_summaries(image_summaries, img_base64_list, image_info, meta_node_info, fname):
+def process_image_summaries(image_summaries, img_bytes_list, image_info, meta_node_info, fname):
+    """Map the content hash of every image to its node metadata"""
     img_nodes_info = {}
-    for _, b64 in enumerate(img_base64_list):
+    for _, image_bytes in enumerate(img_bytes_list):
         img_name = list(image_summaries[_].keys())[0]
         page_number = img_name.split('-')[1]
+        img_hash = image_key(image_bytes)
 
         if image_info[_] is None:
-            img_nodes_info[b64] = {
+            img_nodes_info[img_hash] = {
                 'unstructured_partition_id': None,
                 'coordinates': None,
                 'pagenumber': page_number,
@@ -87,6 +90,6 @@ def process_image_summaries(image_summaries, img_base64_list, image_info, meta_n
             coordinates = image_info[_][0]
             img_id = image_info[_][2]
             node_info = meta_node_info[img_id]
-            img_nodes_info[b64] = node_info
+            img_nodes_info[img_hash] = node_info
 
     return img_nodes_info
\ No newline at end of file
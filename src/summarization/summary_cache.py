@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from src.utils.cache import hit_stats
+from src.utils.sqlite_utils import select_in
+from src.config import Config
+
+
+def _sha256(payload):
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class SummaryCache:
+    """
+    Persistent summaries keyed on (model, prompt version, SHA-256 of the element text or image bytes).
+    The least recently used entries are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, path, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model, prompt, payload):
+        # The prompt text is hashed so that editing a prompt invalidates its summaries
+        return _sha256(f"{model}\0{_sha256(prompt)}\0{_sha256(payload)}")
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        with self._lock, self._conn:
+            found = dict(select_in(self._conn, "SELECT key, summary FROM summaries WHERE key IN ({placeholders})", keys))
+            self._conn.executemany("UPDATE summaries SET last_used = ? WHERE key = ?", [(time.time(), key) for key in found])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO summaries (key, summary, last_used) VALUES (?, ?, ?)",
+                [(key, summary, now) for key, summary in items.items()],
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def stats(self):
+        with self._lock:
+            return hit_stats(self.hits, self.misses)
+
+
+summary_cache = SummaryCache(Config.SUMMARY_CACHE_PATH, Config.SUMMARY_CACHE_MAX_ENTRIES)
+
+async def cached_summaries(payloads, model, prompt, summarize):
+    """
+    Summaries for every payload, in order.
+    summarize(payload) is only awaited for payloads that have no cached summary yet.
+    Returns the summaries and the number of cache hits.
+    """
+    keys = [SummaryCache.key(model, prompt, payload) for payload in payloads]
+    cached = summary_cache.get_many(keys)
+
+    missing = {}
+    for key, payload in zip(keys, payloads):
+        if key not in cached and key not in missing:
+            missing[key] = payload
+    new_summaries = await asyncio.gather(*(summarize(payload) for payload in missing.values()))
+    new_summaries = dict(zip(missing.keys(), new_summaries))
+    if new_summaries:
+        summary_cache.set_many(new_summaries)
+
+    summaries = [cached[key] if key in cached else new_summaries[key] for key in keys]
+    return summaries, len(payloads) - len(missing)
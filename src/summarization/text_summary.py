@@ -1,11 +1,6 @@
-from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-import os
-import asyncio
-
-async def async_invoke(chain, element):
-    return await asyncio.to_thread(chain.invoke, element)
+from src.llm.scheduler import llm_scheduler, get_chat_model, BACKGROUND
+from src.summarization.summary_cache import cached_summaries
 
 # Generate summaries of text elements
 async def generate_text_summaries(texts, tables, summarize_texts=False):
@@ -22,9 +17,13 @@ async def generate_text_summaries(texts, tables, summarize_texts=False):
     Give a concise summary of the table or text that is well optimized for retrieval. Table or text: {element} """
     prompt = ChatPromptTemplate.from_template(prompt_text)
 
-    # Text summary chain
-    model = ChatOpenAI(temperature=0, model="gpt-4", openai_api_key=os.getenv("OPENAI_API_KEY"))
-    summarize_chain = {"element": lambda x: x} | prompt | model | StrOutputParser()
+    # Text summary model; calls go through the shared scheduler as background work
+    model_name = "gpt-4"
+    model = get_chat_model(model_name, temperature=0)
+
+    async def summarize(element):
+        msg = await llm_scheduler.ainvoke(model, prompt.format_messages(element=element), priority=BACKGROUND)
+        return msg.content
 
     # Initialize empty summaries
     text_summaries = {}
@@ -32,16 +31,20 @@ async def generate_text_summaries(texts, tables, summarize_texts=False):
 
     # Apply to text if texts are provided and summarization is requested
     if texts and summarize_texts:
-        tasks = [async_invoke(summarize_chain, list(text.values())[0]) for text in texts]
-        text_summaries = await asyncio.gather(*tasks)
+        text_summaries, hits = await cached_summaries(
+            [list(text.values())[0] for text in texts], model_name, prompt_text, summarize
+        )
+        print(f"Text summary cache hits: {hits}/{len(texts)}")
         text_summaries = [{list(text.keys())[0]: summary} for text, summary in zip(texts, text_summaries)]
     elif texts:
         text_summaries = texts
 
     # Apply to tables if tables are provided
     if tables:
-        tasks = [async_invoke(summarize_chain, list(table.values())[0]) for table in tables]
-        table_summaries = await asyncio.gather(*tasks)
+        table_summaries, hits = await cached_summaries(
+            [list(table.values())[0] for table in tables], model_name, prompt_text, summarize
+        )
+        print(f"Table summary cache hits: {hits}/{len(tables)}")
         table_summaries = [{list(table.keys())[0]: summary} for table, summary in zip(tables, table_summaries)]
 
     return text_summaries, table_summaries
\ No newline at end of file
@@ -0,0 +1,113 @@
+import bisect
+import threading
+
+# Seconds; wide enough for a docstore read at the low end and a whole-PDF partition at the high end
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(list(zip(self.labelnames, key)))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                pairs = list(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(pairs + [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(pairs)} {total}")
+                lines.append(f"{self.name}_count{_labels(pairs)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms, rendered in the Prometheus text exposition format for /metrics.
+    Each API process keeps its own values, so every worker is scraped separately.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "rag_stage_duration_seconds", "Wall-clock time of each ingest and query pipeline stage", ("stage",)
+)
+stage_errors = registry.counter("rag_stage_errors_total", "Pipeline stages that raised", ("stage",))
+llm_calls = registry.counter(
+    "rag_llm_calls_total", "Chat model calls by the stage that made them; outcome is success, retry or error",
+    ("model", "stage", "outcome"),
+)
+llm_tokens = registry.counter(
+    "rag_llm_tokens_total", "Tokens reported by the chat model, by the stage that used them; kind is prompt or completion",
+    ("model", "stage", "kind"),
+)
+embedded_texts = registry.counter(
+    "rag_embedding_texts_total", "Texts embedded, by whether the embedding cache had them", ("cache",)
+)
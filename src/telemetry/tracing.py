@@ -0,0 +1,51 @@
+import contextlib
+import contextvars
+import time
+from opentelemetry import trace
+from src.telemetry.metrics import stage_seconds, stage_errors
+
+tracer = trace.get_tracer("multimodal-rag")
+
+# The innermost running stage, so LLM calls and embeddings can be attributed to the stage that made them
+current_stage = contextvars.ContextVar("current_stage", default="other")
+
+
+@contextlib.contextmanager
+def stage(name, **attributes):
+    """
+    Time a pipeline stage into rag_stage_duration_seconds and record it as an OpenTelemetry span.
+    Spans are no-ops until setup_tracing configures an exporter.
+    """
+    token = current_stage.set(name)
+    start_time = time.perf_counter()
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        try:
+            yield span
+        except Exception:
+            # Not GeneratorExit or CancelledError: a client that disconnects or a cancelled job is not a failed stage
+            stage_errors.inc(stage=name)
+            raise
+        finally:
+            stage_seconds.observe(time.perf_counter() - start_time, stage=name)
+            try:
+                current_stage.reset(token)
+            except ValueError:
+                # An async generator closed from another task ends its stage in a different context
+                pass
+
+
+def setup_tracing(app, otlp_endpoint=None, service_name="multimodal-rag"):
+    """
+    Trace every request to app, with the pipeline stages as child spans.
+    Spans are exported over OTLP when an endpoint is given, and dropped otherwise.
+    """
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    if otlp_endpoint:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint)))
+        trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics")
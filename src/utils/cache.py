@@ -0,0 +1,42 @@
+import threading
+from cachetools import TTLCache
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def hit_stats(hits, misses, **extra):
+    """Counters reported by every cache's stats()"""
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0, **extra}
+
+
+class LRUTTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds, with hit/miss counters."""
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return hit_stats(self.hits, self.misses, size=len(self._cache))
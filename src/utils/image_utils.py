@@ -2,37 +2,58 @@ import base64
 import io
 import re
 from PIL import Image
-from IPython.display import HTML, display
 
 def looks_like_base64(sb):
     return re.match("^[A-Za-z0-9+/]+[=]{0,2}$", sb) is not None
 
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89\x50\x4e\x47\x0d\x0a\x1a\x0a": "image/png",
+    b"\x47\x49\x46\x38": "image/gif",
+    b"\x52\x49\x46\x46": "image/webp",
+}
+
+def image_content_type(data):
+    """MIME type read from the leading bytes of raw image data, None if it is not a known image format"""
+    for sig, content_type in IMAGE_SIGNATURES.items():
+        if data.startswith(sig):
+            return content_type
+    return None
+
 def is_image_data(b64data):
-    image_signatures = {
-        b"\xff\xd8\xff": "jpg",
-        b"\x89\x50\x4e\x47\x0d\x0a\x1a\x0a": "png",
-        b"\x47\x49\x46\x38": "gif",
-        b"\x52\x49\x46\x46": "webp",
-    }
     try:
-        header = base64.b64decode(b64data)[:8]
-        for sig, format in image_signatures.items():
-            if header.startswith(sig):
-                return True
-        return False
+        # 12 base64 characters decode to the 9 bytes the signatures need
+        header = base64.b64decode(b64data[:12] if len(b64data) >= 12 else b64data)[:8]
+        return image_content_type(header) is not None
     except Exception:
         return False
 
 def resize_base64_image(base64_string, size=(128, 128)):
-    img_data = base64.b64decode(base64_string)
+    return resize_image_bytes(base64.b64decode(base64_string), size=size)
+
+def resize_image_bytes(img_data, size=(128, 128)):
+    return base64.b64encode(image_variant(img_data, size=size)[0]).decode("utf-8")
+
+def image_variant(img_data, size=None, max_size=None):
+    """
+    Re-encode an image in its own format, returning the bytes and their MIME type.
+    size: exact (width, height) to resize to
+    max_size: (width, height) to shrink within, keeping the aspect ratio
+    """
     img = Image.open(io.BytesIO(img_data))
-    resized_img = img.resize(size, Image.LANCZOS)
+    image_format = img.format
+    if size:
+        img = img.resize(size, Image.LANCZOS)
+    if max_size:
+        img.thumbnail(max_size, Image.LANCZOS)
     buffered = io.BytesIO()
-    resized_img.save(buffered, format=img.format)
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+    img.save(buffered, format=image_format)
+    return buffered.getvalue(), Image.MIME[image_format]
 
 
 
 def plt_img_base64(img_base64):
+    # Notebook-only helper; IPython is imported here so the app never loads it
+    from IPython.display import HTML, display
     image_html = f'<img src="data:image/jpeg;base64,{img_base64}" />'
     display(HTML(image_html))
\ No newline at end of file
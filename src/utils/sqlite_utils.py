@@ -0,0 +1,15 @@
+# SQLite caps the number of bound parameters per statement, and Chroma the ids one call can take
+MAX_KEYS_PER_QUERY = 500
+
+
+def key_batches(keys, size=MAX_KEYS_PER_QUERY):
+    keys = list(keys)
+    for i in range(0, len(keys), size):
+        yield keys[i:i + size]
+
+def select_in(conn, sql, keys):
+    """Rows of sql for every key, its "{placeholders}" filled in for at most MAX_KEYS_PER_QUERY keys per statement"""
+    rows = []
+    for batch in key_batches(keys):
+        rows += conn.execute(sql.format(placeholders=",".join("?" * len(batch))), batch).fetchall()
+    return rows
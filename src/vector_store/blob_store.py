@@ -0,0 +1,100 @@
+import base64
+import hashlib
+import os
+import time
+from src.utils.image_utils import image_content_type, image_variant
+
+# Size of the copy sent to the answer model, and of the thumbnail for the UI
+PROMPT_IMAGE_SIZE = (1300, 600)
+THUMBNAIL_SIZE = (256, 256)
+
+
+def image_key(data):
+    """SHA-256 hex digest used as the content address of an image."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageBlobStore:
+    """
+    Content-addressed store for raw image bytes on disk.
+    Docstore entries only hold the key; bytes are read when a consumer actually needs them.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:])
+
+    def put(self, data):
+        key = image_key(data)
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        else:
+            # A fresh mtime keeps a blob that is referenced again out of the next garbage collection
+            os.utime(path)
+        return key
+
+    def put_image(self, data):
+        """
+        Store an image together with its prompt-ready and thumbnail variants.
+        Returns the docstore fields that describe it, so queries never decode or sniff image bytes.
+        """
+        prompt_data, prompt_type = image_variant(data, size=PROMPT_IMAGE_SIZE)
+        thumbnail_data, thumbnail_type = image_variant(data, max_size=THUMBNAIL_SIZE)
+        return {
+            'image_ref': self.put(data),
+            'content_type': image_content_type(data),
+            'variants': {
+                'prompt': {'ref': self.put(prompt_data), 'content_type': prompt_type},
+                'thumbnail': {'ref': self.put(thumbnail_data), 'content_type': thumbnail_type},
+            },
+        }
+
+    def get(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def get_base64(self, key):
+        return base64.b64encode(self.get(key)).decode("utf-8")
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def keys(self):
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if not name.endswith(".tmp"):
+                    yield prefix + name
+
+    def collect_garbage(self, referenced, grace_seconds=3600):
+        """
+        Delete blobs whose key is not in referenced. Blobs written or re-put within grace_seconds are kept,
+        since an ingest stores its images before it writes the docstore entries that reference them.
+        Returns the number of blobs and bytes removed.
+        """
+        cutoff = time.time() - grace_seconds
+        removed = removed_bytes = 0
+        for key in list(self.keys()):
+            if key in referenced:
+                continue
+            path = self._path(key)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            removed_bytes += stat.st_size
+        return removed, removed_bytes
@@ -0,0 +1,157 @@
+import collections
+import math
+import re
+import sqlite3
+import sys
+import threading
+from src.vector_store.docstore import is_inline_image, document_of, incremental_compact
+from src.utils.sqlite_utils import MAX_KEYS_PER_QUERY
+
+# Keeps model names, versions and numbers such as "gpt-4o", "llama3.1" and "40x" as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Persistent BM25 inverted index over docstore entries, keyed by doc_id.
+    Postings, document lengths and document frequencies live in SQLite and are updated incrementally,
+    so adding a document never rewrites the index and a query only reads the postings of its terms.
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT, doc_id TEXT, tf INTEGER NOT NULL, PRIMARY KEY (term, doc_id)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, length INTEGER NOT NULL, document TEXT) WITHOUT ROWID"
+        )
+        if "document" not in [row[1] for row in self._conn.execute("PRAGMA table_info(documents)")]:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN document TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_document ON documents (document)")
+        self._conn.commit()
+
+    def add(self, docs):
+        """
+        Index (doc_id, text, document) triples, document being the id_filename the entry belongs to.
+        Entries already in the index are skipped, apart from recording a document they lack.
+        """
+        with self._lock, self._conn:
+            for doc_id, text, document in docs:
+                if self._conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone():
+                    self._conn.execute(
+                        "UPDATE documents SET document = ? WHERE doc_id = ? AND document IS NULL", (document, doc_id)
+                    )
+                    continue
+                counts = collections.Counter(tokenize(text))
+                self._conn.execute(
+                    "INSERT INTO documents (doc_id, length, document) VALUES (?, ?, ?)", (doc_id, sum(counts.values()), document)
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in counts.items()],
+                )
+                self._conn.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in counts],
+                )
+
+    def delete(self, doc_ids):
+        """Remove entries from the index, dropping terms no document uses any more."""
+        with self._lock, self._conn:
+            for doc_id in doc_ids:
+                terms = [term for (term,) in self._conn.execute("SELECT term FROM postings WHERE doc_id = ?", (doc_id,))]
+                if not terms:
+                    continue
+                self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                self._conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(term,) for term in terms])
+            self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+    def compact(self):
+        """Return the space freed by deletions to the filesystem, in small steps"""
+        incremental_compact(self._conn, self._lock)
+
+    def search(self, query, k=4, documents=None):
+        """
+        Top k (doc_id, score) pairs for the query, best first.
+        documents: optional id_filenames to restrict the hits to
+        """
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_KEYS_PER_QUERY]
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            doc_count, total_length = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents").fetchone()
+            if not doc_count:
+                return []
+            dfs = dict(self._conn.execute(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms).fetchall())
+            sql = (
+                f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN documents d ON d.doc_id = p.doc_id "
+                f"WHERE p.term IN ({placeholders})"
+            )
+            params = list(terms)
+            if documents:
+                sql += f" AND d.document IN ({','.join('?' * len(documents))})"
+                params += list(documents)
+            rows = self._conn.execute(sql, params).fetchall()
+
+        average_length = total_length / doc_count
+        scores = collections.defaultdict(float)
+        for term, doc_id, tf, length in rows:
+            idf = math.log(1 + (doc_count - dfs[term] + 0.5) / (dfs[term] + 0.5))
+            scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average_length))
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def index_text(summary, value):
+    """Text indexed for one docstore entry: the summary it is retrieved by, plus its raw text if it has one"""
+    if not isinstance(value, dict) or 'image_ref' in value or is_inline_image(value):
+        return summary
+    content = value.get('content')
+    if isinstance(content, str) and value.get('content_type', 'text/plain').startswith('text/'):
+        return f"{summary}\n{content}"
+    return summary
+
+
+def rebuild_from_vectorstore(index, vectorstore, docstore, batch_size=256, id_key="doc_id"):
+    """Index every summary in the vectorstore together with its docstore entry, for corpora ingested before the index existed."""
+    stored = vectorstore.get(include=["documents", "metadatas"])
+    pairs = [
+        (metadata[id_key], summary, metadata.get("filename"))
+        for summary, metadata in zip(stored["documents"], stored["metadatas"])
+        if metadata and metadata.get(id_key)
+    ]
+    for i in range(0, len(pairs), batch_size):
+        batch = pairs[i:i + batch_size]
+        values = docstore.mget([doc_id for doc_id, _, _ in batch])
+        index.add([
+            (doc_id, index_text(summary, value), filename or document_of(value.get('metadata')))
+            for (doc_id, summary, filename), value in zip(batch, values) if value is not None
+        ])
+    return len(pairs)
+
+
+if __name__ == "__main__":
+    # python -m src.vector_store.bm25_index [./bm25_index.sqlite3]
+    from src.config import Config
+    from src.vector_store.docstore import SQLiteDocStore
+    path = sys.argv[1] if len(sys.argv) > 1 else Config.BM25_INDEX_PATH
+    count = rebuild_from_vectorstore(BM25Index(path), Config.vectorstore, SQLiteDocStore(Config.DOCSTORE_PATH))
+    print(f"Indexed {count} summaries into {path}")
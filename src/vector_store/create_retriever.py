@@ -1,77 +1,124 @@
+import contextlib
 import uuid
 from langchain.retrievers.multi_vector import MultiVectorRetriever
-from langchain.storage import InMemoryStore
 from langchain_core.documents import Document
-import pickle 
-import os
+from src.vector_store.docstore import load_docstore, document_of, page_of
+from src.vector_store.bm25_index import index_text
+from src.vector_store.embedding_cache import CachedEmbeddings
 
 
-def save_in_memory_store(store, path):
-    """Save the InMemoryStore to a file."""
-    with open(path, 'wb') as f:
-        pickle.dump(store, f)
+def summary_metadata(doc_id, meta, id_key="doc_id"):
+    """Chroma metadata of a summary: its doc_id, plus the filename and page it came from so searches can be filtered"""
+    metadata = {id_key: doc_id}
+    filename = document_of(meta)
+    if filename:
+        metadata["filename"] = filename
+    page = page_of(meta)
+    if page is not None:
+        metadata["page"] = page
+    return metadata
+
+def backfill_summary_metadata(vectorstore, docstore, batch_size=256, id_key="doc_id"):
+    """Add filename and page to summaries indexed before they were recorded in Chroma"""
+    stored = vectorstore.get(include=["metadatas"])
+    pending = [
+        (chroma_id, metadata[id_key])
+        for chroma_id, metadata in zip(stored["ids"], stored["metadatas"])
+        if metadata and metadata.get(id_key) and "filename" not in metadata
+    ]
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        values = docstore.mget([doc_id for _, doc_id in batch])
+        updates = [
+            (chroma_id, summary_metadata(doc_id, value.get('metadata'), id_key))
+            for (chroma_id, doc_id), value in zip(batch, values) if value is not None
+        ]
+        if updates:
+            vectorstore._collection.update(ids=[chroma_id for chroma_id, _ in updates], metadatas=[metadata for _, metadata in updates])
+    return len(pending)
+
 
-def load_in_memory_store(path):
-    """Load the InMemoryStore from a file."""
-    with open(path, 'rb') as f:
-        return pickle.load(f)
-    
 def create_or_update_multi_vector_retriever(
-    vectorstore, text_summaries, texts, table_summaries, tables, image_summaries, images, meta_node_info, img_nodes_info, DOCSTORE_PATH
+    vectorstore, text_summaries, texts, table_summaries, tables, image_summaries, images, meta_node_info, img_nodes_info, docstore, image_store=None, bm25_index=None, index_state=None
 ):
     """
     Create or update retriever that indexes summaries, but returns raw images or texts
+    docstore: the SQLiteDocStore new entries are appended to, opened once and shared by every batch of an ingest
+    images: List of raw image bytes, stored in image_store with their prompt and thumbnail variants
+    and referenced from the docstore by hash
+    bm25_index: optional BM25Index that every new entry is also added to
+    index_state: optional IndexState whose lock the writes are made under, for indexes shared by several processes
+    All entries are committed to the docstore as one batch at the end, so queries see all of them or none.
     """
 
-    # Initialize the storage layer
-    if os.path.exists(DOCSTORE_PATH):
-        store = load_in_memory_store(DOCSTORE_PATH)
-    else:
-        store = InMemoryStore()
-    
     id_key = "doc_id"
 
     # Create the multi-vector retriever
     retriever = MultiVectorRetriever(
         vectorstore=vectorstore,
-        docstore=store,
+        docstore=docstore,
         id_key=id_key,
     )
 
+    # Docstore rows stay pending until the whole batch is written; summaries found before then are skipped by queries
+    batch = uuid.uuid4().hex
+
     # Helper function to add documents to the vectorstore and docstore
-    def add_documents(retriever, doc_summaries, doc_contents, doc_meta):
+    def add_documents(retriever, doc_summaries, doc_contents, doc_meta, content_type='text/plain'):
         doc_ids = [str(uuid.uuid4()) for _ in doc_contents]
         summary_docs = [
-            Document(page_content=list(s.values())[0], metadata={id_key: doc_ids[i]})
+            Document(page_content=list(s.values())[0], metadata=summary_metadata(doc_ids[i], doc_meta[i], id_key))
             for i, s in enumerate(doc_summaries)
         ]
         retriever.vectorstore.add_documents(summary_docs)
-        if isinstance(doc_contents[0], dict):
+        if content_type is None:
+            # Contents are already docstore values, such as the image fields from image_store.put_image
+            content_docs = [dict(c, metadata=doc_meta[i]) for i, c in enumerate(doc_contents)]
+            retriever.docstore.mset(list(zip(doc_ids, content_docs)), batch)
+        elif isinstance(doc_contents[0], dict):
             content_docs = [
-                {'content':list(c.values())[0], 'metadata': doc_meta[i]}
+                {'content':list(c.values())[0], 'content_type': content_type, 'metadata': doc_meta[i]}
                 for i, c in enumerate(doc_contents)
             ]
-            retriever.docstore.mset(list(zip(doc_ids, content_docs)))
+            retriever.docstore.mset(list(zip(doc_ids, content_docs)), batch)
         else:
             content_docs = [
-                {'content': doc_contents[i], 'metadata': doc_meta[i]}
+                {'content': doc_contents[i], 'content_type': content_type, 'metadata': doc_meta[i]}
                 for i in range(len(doc_contents))
             ]
-            retriever.docstore.mset(list(zip(doc_ids, content_docs)))
+            retriever.docstore.mset(list(zip(doc_ids, content_docs)), batch)
+        if bm25_index is not None:
+            bm25_index.add([
+                (doc_id, index_text(summary_doc.page_content, content_doc), summary_doc.metadata.get("filename"))
+                for doc_id, summary_doc, content_doc in zip(doc_ids, summary_docs, content_docs)
+            ])
     
+    # Images are stored, and summaries embedded (into the embedding cache), before the index lock is taken
+    image_entries = [image_store.put_image(image) for image in images] if image_summaries else []
+    summaries = [list(s.values())[0] for s in (text_summaries or []) + (table_summaries or []) + (image_summaries or [])]
+    if summaries and isinstance(vectorstore.embeddings, CachedEmbeddings):
+        vectorstore.embeddings.embed_documents(summaries)
+
     # Add texts, tables, and images
     # Check that text_summaries is not empty before adding
-    if text_summaries:
-        texts_meta = [meta_node_info.get(list(text.keys())[0], {}) for text in texts]
-        add_documents(retriever, text_summaries, texts, texts_meta)
-    if table_summaries:
-        tables_meta = [meta_node_info.get(list(table.keys())[0], {}) for table in tables]
-        add_documents(retriever, table_summaries, tables, tables_meta)
-    if image_summaries:
-        images_meta = [img_nodes_info.get(img_file, {}) for img_file in images]
-        add_documents(retriever, image_summaries, images, images_meta)
-    
-    # Save the updated docstore to disk
-    save_in_memory_store(retriever.docstore, DOCSTORE_PATH)
-    
+    with index_state.write() if index_state is not None else contextlib.nullcontext():
+        if text_summaries:
+            texts_meta = [meta_node_info.get(list(text.keys())[0], {}) for text in texts]
+            add_documents(retriever, text_summaries, texts, texts_meta)
+        if table_summaries:
+            tables_meta = [meta_node_info.get(list(table.keys())[0], {}) for table in tables]
+            add_documents(retriever, table_summaries, tables, tables_meta)
+        if image_summaries:
+            images_meta = [img_nodes_info.get(entry['image_ref'], {}) for entry in image_entries]
+            add_documents(retriever, image_summaries, image_entries, images_meta, content_type=None)
+        if summaries:
+            docstore.commit_batch(batch)
+
     return retriever
+
+
+if __name__ == "__main__":
+    # python -m src.vector_store.create_retriever
+    from src.config import Config
+    count = backfill_summary_metadata(Config.vectorstore, load_docstore(Config.DOCSTORE_PATH))
+    print(f"Added filename and page metadata to {count} summaries")
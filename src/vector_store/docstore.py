@@ -0,0 +1,263 @@
+import base64
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+from langchain_core.stores import BaseStore
+from src.utils.image_utils import looks_like_base64, is_image_data
+from src.telemetry.tracing import stage
+from src.utils.sqlite_utils import select_in
+
+# Pending marker of entries that are being deleted
+RETRACTED = "retracted"
+
+
+def incremental_compact(conn, lock, pages_per_step=1024):
+    """
+    Return free pages of an SQLite database to the filesystem a few at a time,
+    releasing the lock between steps so reads and writes are not held up.
+    Databases created before auto_vacuum was enabled are converted by one full VACUUM first.
+    """
+    with lock:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+    while True:
+        with lock:
+            if conn.execute("PRAGMA freelist_count").fetchone()[0] == 0:
+                break
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages_per_step)})").fetchall()
+    with lock:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def document_of(metadata):
+    """id_filename of the PDF an entry was extracted from, read from its element metadata"""
+    elements = metadata if isinstance(metadata, list) else [metadata]
+    for element in elements:
+        if isinstance(element, dict) and element.get('filename'):
+            return element['filename']
+    return None
+
+def page_of(metadata):
+    """First page an entry covers, None if unknown"""
+    elements = metadata if isinstance(metadata, list) else [metadata]
+    pages = [
+        element['pagenumber'] for element in elements
+        if isinstance(element, dict) and isinstance(element.get('pagenumber'), int)
+    ]
+    return min(pages) if pages else None
+
+
+class SQLiteDocStore(BaseStore):
+    """Disk-backed docstore with one row per doc_id, indexed by document and versioned on every commit"""
+
+    def __init__(self, path, mmap_size=256 * 1024 * 1024):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        # Only takes effect for a new file; compact() converts older ones
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS docstore (doc_id TEXT PRIMARY KEY, value TEXT NOT NULL, document TEXT)")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(docstore)")]
+        if "document" not in columns:
+            self._add_document_column()
+        # NULL for committed rows, otherwise the ingest batch that has not committed yet, or RETRACTED
+        if "pending" not in columns:
+            self._conn.execute("ALTER TABLE docstore ADD COLUMN pending TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS docstore_document ON docstore (document)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS docstore_pending ON docstore (pending) WHERE pending IS NOT NULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('corpus_version', 0)")
+        self._conn.commit()
+
+    def _add_document_column(self):
+        """Upgrade a docstore written before rows were partitioned by document"""
+        self._conn.execute("ALTER TABLE docstore ADD COLUMN document TEXT")
+        rows = self._conn.execute("SELECT doc_id, value FROM docstore").fetchall()
+        self._conn.executemany(
+            "UPDATE docstore SET document = ? WHERE doc_id = ?",
+            [(document_of(json.loads(value).get('metadata')), doc_id) for doc_id, value in rows],
+        )
+
+    def _bump_version(self):
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'corpus_version'")
+
+    def version(self):
+        """Counter that changes whenever entries are written or deleted, also by other connections to the file."""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'corpus_version'").fetchone()[0]
+
+    def has_flag(self, name):
+        """Whether a one-off upgrade of this file, such as 'legacy_migrated', was done before"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (name,)).fetchone() is not None
+
+    def set_flag(self, name):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, 1)", (name,))
+
+    def untyped_entries(self):
+        """(doc_id, value) of the committed entries without a content_type or image_ref, as the pickled docstore wrote them"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, value FROM docstore WHERE pending IS NULL "
+                "AND value NOT LIKE '%\"content_type\"%' AND value NOT LIKE '%\"image_ref\"%'"
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def mget(self, keys):
+        keys = list(keys)
+        with stage("docstore_mget", keys=len(keys)):
+            with self._lock:
+                found = dict(select_in(
+                    self._conn, "SELECT doc_id, value FROM docstore WHERE doc_id IN ({placeholders}) AND pending IS NULL", keys
+                ))
+            return [json.loads(found[key]) if key in found else None for key in keys]
+
+    def mset(self, key_value_pairs, batch=None):
+        """batch: optional ingest batch id; its rows stay invisible until commit_batch(batch)"""
+        rows = [
+            (key, json.dumps(value), document_of(value.get('metadata')) if isinstance(value, dict) else None, batch)
+            for key, value in key_value_pairs
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docstore (doc_id, value, document, pending) VALUES (?, ?, ?, ?)", rows
+            )
+            if batch is None:
+                self._bump_version()
+
+    def commit_batch(self, batch):
+        """Make every row of an ingest batch visible at once, as one new version. Returns the number of rows."""
+        with self._lock, self._conn:
+            count = self._conn.execute("UPDATE docstore SET pending = NULL WHERE pending = ?", (batch,)).rowcount
+            self._bump_version()
+        return count
+
+    def retract(self, keys):
+        """Hide entries from reads in one new version; keys_for_document lists them until mdelete"""
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE docstore SET pending = ? WHERE doc_id = ?", [(RETRACTED, key) for key in keys])
+            self._bump_version()
+
+    def mdelete(self, keys):
+        keys = list(keys)
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM docstore WHERE doc_id = ?", [(key,) for key in keys])
+            self._bump_version()
+
+    def yield_keys(self, prefix=None):
+        with self._lock:
+            if prefix is None:
+                rows = self._conn.execute("SELECT doc_id FROM docstore WHERE pending IS NULL").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT doc_id FROM docstore WHERE doc_id LIKE ? AND pending IS NULL", (prefix + "%",)
+                ).fetchall()
+        for (key,) in rows:
+            yield key
+
+    def documents(self):
+        """Number of entries per document"""
+        with self._lock:
+            return dict(
+                self._conn.execute("SELECT document, COUNT(*) FROM docstore WHERE pending IS NULL GROUP BY document").fetchall()
+            )
+
+    def referenced_blobs(self):
+        """Every blob store key an entry refers to, pending ones included: image originals and their variants"""
+        keys = set()
+        with self._lock:
+            rows = self._conn.execute("SELECT value FROM docstore WHERE value LIKE '%\"image_ref\"%'").fetchall()
+        for (value,) in rows:
+            value = json.loads(value)
+            if 'image_ref' in value:
+                keys.add(value['image_ref'])
+                keys.update(variant['ref'] for variant in value.get('variants', {}).values())
+        return keys
+
+    def compact(self):
+        """Return the space freed by deletions to the filesystem, in small steps"""
+        incremental_compact(self._conn, self._lock)
+
+    def keys_for_document(self, document):
+        """doc_ids of every entry of the document, including pending and retracted ones"""
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id FROM docstore WHERE document = ?", (document,)).fetchall()
+        return [key for (key,) in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docstore WHERE pending IS NULL").fetchone()[0]
+
+
+def load_in_memory_store(path):
+    """Load a legacy pickled InMemoryStore from a file."""
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def is_inline_image(value):
+    """
+    True for an entry that holds a base64 image inline, as the pickled docstore did.
+    Entries written since content types are recorded are never sniffed.
+    """
+    if not isinstance(value, dict) or 'content_type' in value or 'image_ref' in value:
+        return False
+    content = value.get('content')
+    return isinstance(content, str) and looks_like_base64(content) and is_image_data(content)
+
+def _migrate_value(value, image_store):
+    """Move a legacy base64 image into the blob store, keeping its references, and mark other entries text/plain"""
+    if is_inline_image(value):
+        if image_store is None:
+            return value
+        return dict(image_store.put_image(base64.b64decode(value['content'])), metadata=value['metadata'])
+    if isinstance(value, dict) and 'content_type' not in value and 'image_ref' not in value:
+        return dict(value, content_type='text/plain')
+    return value
+
+def migrate_pickle_docstore(pickle_path, store, image_store=None, batch_size=256):
+    """Copy every entry of a legacy pickled InMemoryStore into store."""
+    legacy = load_in_memory_store(pickle_path)
+    items = [(key, _migrate_value(value, image_store)) for key, value in legacy.store.items()]
+    for i in range(0, len(items), batch_size):
+        store.mset(items[i:i + batch_size])
+    store.set_flag('legacy_migrated')
+    store.set_flag('legacy_typed')
+    return len(items)
+
+def type_legacy_entries(store, image_store=None, batch_size=256):
+    """Give entries migrated before their content type was recorded one, moving inline images to image_store."""
+    items = [(key, _migrate_value(value, image_store)) for key, value in store.untyped_entries()]
+    for i in range(0, len(items), batch_size):
+        store.mset(items[i:i + batch_size])
+    store.set_flag('legacy_typed')
+    return len(items)
+
+def load_docstore(path, legacy_path=None, image_store=None):
+    """Open the SQLite docstore at path, migrating a legacy docstore.pkl into it once, if it is empty"""
+    store = SQLiteDocStore(path)
+    if not store.has_flag('legacy_migrated'):
+        if legacy_path and os.path.exists(legacy_path) and len(store) == 0:
+            count = migrate_pickle_docstore(legacy_path, store, image_store)
+            print(f"Migrated {count} entries from {legacy_path} to {path}")
+        else:
+            store.set_flag('legacy_migrated')
+    if not store.has_flag('legacy_typed'):
+        count = type_legacy_entries(store, image_store)
+        if count:
+                print(f"Recorded the content type of {count} legacy entries in {path}")
+    return store
+
+
+if __name__ == "__main__":
+    # python -m src.vector_store.docstore ./docstore.pkl ./docstore.sqlite3 ./image_store
+    from src.vector_store.blob_store import ImageBlobStore
+    pickle_path, sqlite_path, image_store_path = sys.argv[1], sys.argv[2], sys.argv[3]
+    count = migrate_pickle_docstore(pickle_path, SQLiteDocStore(sqlite_path), ImageBlobStore(image_store_path))
+    print(f"Migrated {count} entries from {pickle_path} to {sqlite_path}")
@@ -0,0 +1,116 @@
+import csv
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentRegistry:
+    """
+    SQLite record of uploaded documents, replacing mapping.csv.
+    Lookups by content hash and id_filename are indexed, and IDs come from an AUTOINCREMENT key,
+    so concurrent uploads never share an ID and IDs of deleted documents are not reused.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_filename TEXT UNIQUE,
+                original_filename TEXT,
+                file_size INTEGER,
+                sha256 TEXT UNIQUE,
+                created_at REAL NOT NULL
+            )"""
+        )
+
+    def _row(self, sql, params):
+        cursor = self._conn.execute(sql, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def get(self, id_filename):
+        with self._lock:
+            return self._row("SELECT * FROM documents WHERE id_filename = ?", (id_filename,))
+
+    def register(self, original_filename, file_size, sha256):
+        """
+        Allocate an id_filename for new content, atomically.
+        Returns (document, created); created is False if a document with the same hash already exists.
+        """
+        with self._lock:
+            # BEGIN IMMEDIATE also serializes against other processes using the same file
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._row("SELECT * FROM documents WHERE sha256 = ?", (sha256,))
+                if existing is not None:
+                    self._conn.execute("COMMIT")
+                    return existing, False
+                cursor = self._conn.execute(
+                    "INSERT INTO documents (original_filename, file_size, sha256, created_at) VALUES (?, ?, ?, ?)",
+                    (original_filename, file_size, sha256, time.time()),
+                )
+                id_filename = f"{cursor.lastrowid:04d}.pdf"
+                self._conn.execute("UPDATE documents SET id_filename = ? WHERE id = ?", (id_filename, cursor.lastrowid))
+                document = self._row("SELECT * FROM documents WHERE id = ?", (cursor.lastrowid,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return document, True
+
+    def delete(self, id_filename):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE id_filename = ?", (id_filename,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def import_mapping_csv(self, csv_path, upload_dir):
+        """
+        Copy the rows of a legacy mapping.csv, keeping their IDs.
+        Hashes are computed for the files that are present; rows without a file keep their ID reserved.
+        """
+        with open(csv_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    path = os.path.join(upload_dir, row["id_filename"])
+                    sha256 = file_sha256(path) if os.path.exists(path) else None
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO documents (id, id_filename, original_filename, file_size, sha256, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (int(row["id_filename"].split(".")[0]), row["id_filename"], row["original_filename"],
+                         int(row["file_size"]), sha256, time.time()),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+
+def load_registry(path, legacy_csv_path=None, upload_dir=None):
+    """Open the registry at path, importing a legacy mapping.csv the first time."""
+    registry = DocumentRegistry(path)
+    if legacy_csv_path and os.path.exists(legacy_csv_path) and len(registry) == 0:
+        count = registry.import_mapping_csv(legacy_csv_path, upload_dir)
+        print(f"Imported {count} documents from {legacy_csv_path} to {path}")
+    return registry
@@ -0,0 +1,58 @@
+import contextlib
+import time
+from src.utils.sqlite_utils import key_batches
+
+
+def document_entries(document, vectorstore, docstore, id_key="doc_id"):
+    """
+    doc_ids of every entry of an uploaded document (its id_filename): its docstore rows, which are its manifest,
+    and summaries whose docstore row was never written, e.g. by an ingest that failed half way
+    """
+    doc_ids = set(docstore.keys_for_document(document))
+    stored = vectorstore._collection.get(where={"filename": document}, include=["metadatas"])
+    doc_ids.update(metadata[id_key] for metadata in stored["metadatas"] if metadata and metadata.get(id_key))
+    return sorted(doc_ids)
+
+def _remove_entries(doc_ids, vectorstore, docstore, bm25_index, id_key):
+    # Retracted first, in one commit, so queries stop returning them all at once, and deleted from the docstore last
+    if not doc_ids:
+        return
+    docstore.retract(doc_ids)
+    for batch in key_batches(doc_ids):
+        vectorstore._collection.delete(where={id_key: {"$in": batch}})
+    if bm25_index is not None:
+        bm25_index.delete(doc_ids)
+    docstore.mdelete(doc_ids)
+
+def delete_entries(doc_ids, vectorstore, docstore, bm25_index=None, id_key="doc_id", index_state=None):
+    """
+    Remove the given entries from the vectorstore, the BM25 index and the docstore, e.g. those a re-ingest replaced.
+    Returns the number of entries removed.
+    """
+    doc_ids = list(doc_ids)
+    with index_state.write() if index_state is not None else contextlib.nullcontext():
+        _remove_entries(doc_ids, vectorstore, docstore, bm25_index, id_key)
+    return len(doc_ids)
+
+def delete_document(document, vectorstore, docstore, bm25_index=None, id_key="doc_id", index_state=None):
+    """
+    Remove every entry of an uploaded document (its id_filename) from the vectorstore, the BM25 index and the docstore.
+    Queries stop returning the document all at once. Image blobs are left for compact_stores,
+    since other documents may share them. Returns the number of entries removed.
+    index_state: optional IndexState whose lock the deletion is made under, for indexes shared by several processes
+    """
+    with index_state.write() if index_state is not None else contextlib.nullcontext():
+        doc_ids = document_entries(document, vectorstore, docstore, id_key)
+        _remove_entries(doc_ids, vectorstore, docstore, bm25_index, id_key)
+    return len(doc_ids)
+
+def compact_stores(docstore, bm25_index=None, image_store=None, grace_seconds=3600):
+    """Reclaim the space left by deleted documents: unreferenced image blobs and free pages in the SQLite files."""
+    start_time = time.time()
+    removed = removed_bytes = 0
+    if image_store is not None:
+        removed, removed_bytes = image_store.collect_garbage(docstore.referenced_blobs(), grace_seconds)
+    docstore.compact()
+    if bm25_index is not None:
+        bm25_index.compact()
+    print(f"Compaction removed {removed} image blobs ({removed_bytes / 1024:.0f} KB). Time taken: {time.time() - start_time:.2f} seconds")
@@ -0,0 +1,99 @@
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.telemetry.metrics import embedded_texts
+from src.telemetry.tracing import stage
+from src.utils.cache import hit_stats
+from src.utils.sqlite_utils import select_in
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with a disk-persisted cache keyed on (model, text hash).
+    Vectors are stored as raw float32 blobs, and all cache misses of a call are embedded in one request.
+    Covers both document and query embeddings.
+    """
+
+    def __init__(self, underlying, path, model_name=None):
+        self.underlying = underlying
+        self.model_name = model_name or getattr(underlying, "model", type(underlying).__name__)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, texts):
+        """Return the keys of texts, the cached vectors and the unique texts that still need embedding."""
+        keys = [self._key(text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            rows = select_in(self._conn, "SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", unique_keys)
+        cached = {key: np.frombuffer(vector, dtype=np.float32) for key, vector in rows}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        embedded_texts.inc(len(texts) - len(missing), cache="hit")
+        embedded_texts.inc(len(missing), cache="miss")
+        return keys, cached, missing
+
+    def _store(self, missing, vectors):
+        new_vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing.keys(), vectors)}
+        if new_vectors:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in new_vectors.items()],
+                )
+        return new_vectors
+
+    @staticmethod
+    def _collect(keys, cached, new_vectors):
+        return [(cached[key] if key in cached else new_vectors[key]).tolist() for key in keys]
+
+    def embed_documents(self, texts):
+        keys, cached, missing = self._lookup(texts)
+        vectors = []
+        if missing:
+            with stage("embedding", texts=len(missing)):
+                vectors = self.underlying.embed_documents(list(missing.values()))
+        return self._collect(keys, cached, self._store(missing, vectors))
+
+    def embed_query(self, text):
+        keys, cached, missing = self._lookup([text])
+        vectors = []
+        if missing:
+            with stage("embedding", texts=1):
+                vectors = [self.underlying.embed_query(text)]
+        return self._collect(keys, cached, self._store(missing, vectors))[0]
+
+    async def aembed_documents(self, texts):
+        keys, cached, missing = self._lookup(texts)
+        vectors = []
+        if missing:
+            with stage("embedding", texts=len(missing)):
+                vectors = await self.underlying.aembed_documents(list(missing.values()))
+        return self._collect(keys, cached, self._store(missing, vectors))
+
+    async def aembed_query(self, text):
+        keys, cached, missing = self._lookup([text])
+        vectors = []
+        if missing:
+            with stage("embedding", texts=1):
+                vectors = [await self.underlying.aembed_query(text)]
+        return self._collect(keys, cached, self._store(missing, vectors))[0]
+
+    def stats(self):
+        with self._lock:
+            return hit_stats(self.hits, self.misses)
@@ -0,0 +1,180 @@
+import contextlib
+import fcntl
+import os
+import sys
+import threading
+
+# Keeping a local Chroma store in sync across processes (SYNC_LOCAL_CHROMA) uses Chroma internals, checked against these releases
+SUPPORTED_CHROMADB_VERSIONS = ("0.5.3",)
+# The internals used: on the in-process Chroma, its segment manager and its embeddings log
+_SERVER_ATTRIBUTES = {"_manager": ("_instances", "_lock", "get_segment"), "_producer": ("_subscriptions", "_backfill", "unsubscribe")}
+# and on an open vector index
+_SEGMENT_ATTRIBUTES = ("_max_seq_id", "_sync_threshold", "_params", "_subscription", "_get_metadata_file")
+
+
+def _local_server(vectorstore):
+    """The in-process Chroma behind the vectorstore, None with a Chroma server (CHROMA_HOST)"""
+    from chromadb.api.segment import SegmentAPI
+    server = vectorstore._client._server
+    return server if isinstance(server, SegmentAPI) else None
+
+
+def _vector_segments(server):
+    """This process's open local Chroma vector indexes"""
+    from chromadb.segment.impl.vector.local_hnsw import LocalHnswSegment
+    return [segment for segment in list(server._manager._instances.values()) if isinstance(segment, LocalHnswSegment)]
+
+
+def check_local_chroma(vectorstore):
+    """Raise RuntimeError unless chromadb is a supported release with the internals catch_up_vectorstore uses"""
+    import chromadb
+    from chromadb.segment.impl.vector.local_persistent_hnsw import PersistentLocalHnswSegment
+    server = _local_server(vectorstore)
+    if server is None:
+        return
+    if chromadb.__version__ not in SUPPORTED_CHROMADB_VERSIONS:
+        raise RuntimeError(
+            f"SYNC_LOCAL_CHROMA does not support chromadb {chromadb.__version__} "
+            f"(supported: {', '.join(SUPPORTED_CHROMADB_VERSIONS)}); set CHROMA_HOST to use a Chroma server"
+        )
+    missing = [
+        f"{component}.{name}"
+        for component, names in _SERVER_ATTRIBUTES.items()
+        for name in names if not hasattr(getattr(server, component, None), name)
+    ]
+    if not missing:
+        for segment in _vector_segments(server):
+            if not isinstance(segment, PersistentLocalHnswSegment):
+                missing.append(f"{type(segment).__name__} is not a PersistentLocalHnswSegment")
+            missing += [f"{type(segment).__name__}.{name}" for name in _SEGMENT_ATTRIBUTES if not hasattr(segment, name)]
+    if missing:
+        raise RuntimeError(f"chromadb {chromadb.__version__} lacks internals SYNC_LOCAL_CHROMA needs: {', '.join(missing)}")
+
+
+def catch_up_vectorstore(vectorstore, persist=False):
+    """Replay the Chroma log written by other processes into this process's vector index; persist it only if asked"""
+    from chromadb.segment.impl.vector.local_persistent_hnsw import PersistentLocalHnswSegment
+    server = _local_server(vectorstore)
+    if server is None:
+        return
+    queue = server._producer
+    for subscriptions in list(queue._subscriptions.values()):
+        for subscription in list(subscriptions):
+            segment = getattr(subscription.callback, "__self__", None)
+            if isinstance(segment, PersistentLocalHnswSegment):
+                segment._sync_threshold = segment._params.sync_threshold if persist else sys.maxsize
+                subscription.start = segment._max_seq_id
+                queue._backfill(subscription)
+
+
+def reload_vectorstore(vectorstore):
+    """Load this process's copy of the local Chroma vector index again from its files and the log"""
+    from chromadb.segment import VectorReader
+    from chromadb.segment.impl.vector.local_hnsw import LocalHnswSegment
+    server = _local_server(vectorstore)
+    if server is None:
+        return
+    manager = server._manager
+    with manager._lock:
+        for segment_id, segment in list(manager._instances.items()):
+            if isinstance(segment, LocalHnswSegment):
+                del manager._instances[segment_id]
+                server._producer.unsubscribe(segment._subscription)
+    # Opened now, under the index lock, rather than by the first search while another process may be persisting it
+    manager.get_segment(vectorstore._collection.id, VectorReader)
+
+
+def persisted_version(vectorstore):
+    """Identifies the files the local Chroma vector index was last persisted to; empty before it first is"""
+    server = _local_server(vectorstore)
+    version = []
+    for segment in _vector_segments(server) if server is not None else []:
+        with contextlib.suppress(FileNotFoundError):
+            stat = os.stat(segment._get_metadata_file())
+            version.append((stat.st_mtime_ns, stat.st_size))
+    return version
+
+
+class IndexLock:
+    """Exclusive lock on the shared index, across threads and, through flock, processes on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def hold(self, blocking=True, processes=True):
+        """Yields whether the lock was acquired; processes=False only excludes this process's threads"""
+        if not self._thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if not processes:
+                yield True
+                return
+            with open(self.path, "a") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                except BlockingIOError:
+                    acquired = False
+                # Closing the file releases the flock
+                yield acquired
+        finally:
+            self._thread_lock.release()
+
+
+class IndexState:
+    """Index lock and corpus version of the shared stores; the docstore commit is what makes a write visible"""
+
+    def __init__(self, vectorstore, docstore, lock, worker_processes=1, sync_local_chroma=False):
+        """sync_local_chroma: replay other processes' writes into this process's local Chroma index (SYNC_LOCAL_CHROMA)"""
+        self.vectorstore = vectorstore
+        self.docstore = docstore
+        self.lock = lock
+        self.worker_processes = worker_processes
+        self.sync_local_chroma = sync_local_chroma
+        self.seen_version = None
+        self.loaded_version = None
+
+    def open(self):
+        """Raises RuntimeError for several worker processes on a local Chroma store that is not kept in sync"""
+        if self.sync_local_chroma:
+            check_local_chroma(self.vectorstore)
+            with self.lock.hold():
+                # Loaded under the lock, so never while another process is persisting it
+                reload_vectorstore(self.vectorstore)
+                check_local_chroma(self.vectorstore)
+                self.loaded_version = persisted_version(self.vectorstore)
+        elif self.worker_processes > 1 and _local_server(self.vectorstore) is not None:
+            raise RuntimeError(
+                f"{self.worker_processes} worker processes are configured, which need a Chroma server: set CHROMA_HOST"
+            )
+        self.seen_version = self.docstore.version()
+
+    def refresh(self):
+        """Corpus version, with the local vector index caught up with it if it is kept in sync"""
+        version = self.docstore.version()
+        if version != self.seen_version:
+            # Reads never wait for a writer; while a thread of this process writes, they retry on the next call
+            with self.lock.hold(blocking=False, processes=False) as acquired:
+                if acquired:
+                    if self.sync_local_chroma:
+                        catch_up_vectorstore(self.vectorstore)
+                    self.seen_version = version
+        return version
+
+    @contextlib.contextmanager
+    def write(self):
+        """Hold the index lock for one write to the shared stores"""
+        with self.lock.hold():
+            if self.sync_local_chroma:
+                if persisted_version(self.vectorstore) == self.loaded_version:
+                    catch_up_vectorstore(self.vectorstore, persist=True)
+                else:
+                    # Another process persisted the index; never write over its files from an older graph
+                    reload_vectorstore(self.vectorstore)
+            yield
+            if self.sync_local_chroma:
+                self.loaded_version = persisted_version(self.vectorstore)
+            self.seen_version = self.docstore.version()
@@ -0,0 +1,94 @@
+import threading
+from langchain.retrievers.multi_vector import MultiVectorRetriever
+from src.config import Config
+from src.llm.scheduler import get_chat_model
+from src.vector_store.docstore import load_docstore
+from src.vector_store.index_state import IndexLock, IndexState
+from src.rag.rag_chain import (
+    multi_modal_rag_chain_with_reranking,
+    multi_modal_rag_stream_with_reranking,
+    multi_modal_rag_batch_with_reranking,
+)
+
+
+class RetrieverService:
+    """Process-wide holder for the multi-vector retriever and the RAG chain"""
+
+    def __init__(self, vectorstore, docstore_path, legacy_docstore_path=None, image_store=None, lock_path=None):
+        self.vectorstore = vectorstore
+        self.image_store = image_store
+        self.docstore_path = docstore_path
+        self.legacy_docstore_path = legacy_docstore_path
+        self.lock = IndexLock(lock_path or docstore_path + ".lock")
+        self.model = get_chat_model("gpt-4o-mini", temperature=0, max_tokens=1024)
+        self.docstore = None
+        self.index_state = None
+        self.retriever = None
+        self.chain = None
+        self.stream_chain = None
+        self.batch_chain = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        self.docstore = load_docstore(self.docstore_path, self.legacy_docstore_path, self.image_store)
+        self.index_state = IndexState(
+            self.vectorstore, self.docstore, self.lock, Config.WORKER_PROCESSES, Config.SYNC_LOCAL_CHROMA
+        )
+        self.index_state.open()
+        self.retriever = MultiVectorRetriever(
+            vectorstore=self.vectorstore,
+            docstore=self.docstore,
+            id_key="doc_id",
+        )
+        self.chain = multi_modal_rag_chain_with_reranking(self.retriever, model=self.model)
+        self.stream_chain = multi_modal_rag_stream_with_reranking(self.retriever, model=self.model)
+        self.batch_chain = multi_modal_rag_batch_with_reranking(self.retriever, model=self.model)
+
+    def load(self):
+        """Open the docstore and build the retriever and chain."""
+        with self._lock:
+            if self.chain is None:
+                self._load()
+
+    def get_chain(self):
+        if self.chain is None:
+            self.load()
+        return self.chain
+
+    def get_docstore(self):
+        if self.docstore is None:
+            self.load()
+        return self.docstore
+
+    def get_index_state(self):
+        if self.index_state is None:
+            self.load()
+        return self.index_state
+
+    def corpus_version(self):
+        return self.get_index_state().refresh()
+
+    def get_batch_chain(self):
+        if self.batch_chain is None:
+            self.load()
+        return self.batch_chain
+
+    def get_stream_chain(self):
+        if self.stream_chain is None:
+            self.load()
+        return self.stream_chain
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_retriever_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RetrieverService(
+                    Config.vectorstore, Config.DOCSTORE_PATH, Config.LEGACY_DOCSTORE_PATH, Config.image_store,
+                    Config.INDEX_LOCK_PATH,
+                )
+    return _service
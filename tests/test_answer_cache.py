@@ -0,0 +1,34 @@
+from src.rag.answer_cache import AnswerCache
+
+
+def test_entries_are_dropped_when_the_corpus_version_changes():
+    cache = AnswerCache(maxsize=10, similarity_threshold=0.9)
+    cache.set("What is BM25?", [1.0, 0.0], "answer", version=1)
+
+    assert cache.get("  what is bm25?", version=1) == "answer"
+    assert cache.get_similar([0.99, 0.05], version=1) == "answer"
+
+    # An ingest committed: nothing cached for the old corpus is returned
+    assert cache.get("What is BM25?", version=2) is None
+    assert cache.get_similar([1.0, 0.0], version=2) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_results_of_an_outdated_version_are_not_stored():
+    cache = AnswerCache(maxsize=10, similarity_threshold=0.9)
+    cache.set("q", None, "new", version=2)
+
+    cache.set("late", None, "old", version=1)
+
+    assert cache.get("late", version=2) is None
+    assert cache.get("q", version=2) == "new"
+
+
+def test_scopes_do_not_share_entries():
+    cache = AnswerCache(maxsize=10, similarity_threshold=0.9)
+    scope = AnswerCache.scope(["0002.pdf", "0001.pdf"])
+    cache.set("q", [1.0, 0.0], "scoped", version=1, scope=scope)
+
+    assert cache.get("q", version=1) is None
+    assert cache.get_similar([1.0, 0.0], version=1) is None
+    assert cache.get("q", version=1, scope=AnswerCache.scope(["0001.pdf", "0002.pdf"])) == "scoped"
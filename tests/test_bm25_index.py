@@ -0,0 +1,33 @@
+from src.vector_store.bm25_index import BM25Index
+
+
+def document_frequencies(index):
+    return dict(index._conn.execute("SELECT term, df FROM terms").fetchall())
+
+
+def test_delete_updates_document_frequencies(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add([
+        ("a", "gpt-4o pricing table", "0001.pdf"),
+        ("b", "pricing of llama3.1", "0001.pdf"),
+        ("c", "pricing table", "0002.pdf"),
+    ])
+    assert document_frequencies(index) == {"gpt-4o": 1, "pricing": 3, "table": 2, "of": 1, "llama3.1": 1}
+
+    index.delete(["a", "missing"])
+
+    # Terms only the deleted entry used are dropped
+    assert document_frequencies(index) == {"pricing": 2, "table": 1, "of": 1, "llama3.1": 1}
+    assert len(index) == 2
+    assert index.search("gpt-4o") == []
+    assert [doc_id for doc_id, _ in index.search("table")] == ["c"]
+
+
+def test_re_adding_an_entry_does_not_count_its_terms_twice(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add([("a", "pricing table", None)])
+
+    index.add([("a", "pricing table", "0001.pdf")])
+
+    assert document_frequencies(index) == {"pricing": 1, "table": 1}
+    assert index.search("pricing", documents=["0001.pdf"])[0][0] == "a"
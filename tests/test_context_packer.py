@@ -0,0 +1,44 @@
+import pytest
+from benchmarks.fakes import RegexEncoding
+from src.rag import context_packer
+from src.rag.context_packer import pack_context, IMAGE_PROMPT_TOKENS
+
+
+@pytest.fixture(autouse=True)
+def word_encoding(monkeypatch):
+    # One token per word, so budgets are easy to count and no encoding file is downloaded
+    monkeypatch.setitem(context_packer._encodings, "words", RegexEncoding())
+
+
+def text(words):
+    return {"content": " ".join(f"w{i}" for i in range(words)), "content_type": "text/plain"}
+
+
+def test_text_that_does_not_fit_is_truncated_to_the_budget():
+    sources = [text(6), text(10)]
+
+    packed, indices = pack_context(sources, token_budget=10, max_images=0, min_truncated_tokens=3, model="words")
+
+    assert indices == [0, 1]
+    assert packed[0] == sources[0]
+    assert packed[1]["content"] == "w0 w1 w2 w3 "
+
+
+def test_too_small_a_remainder_drops_the_text_but_later_sources_may_fit():
+    sources = [text(8), text(5), text(2)]
+
+    packed, indices = pack_context(sources, token_budget=10, max_images=0, min_truncated_tokens=3, model="words")
+
+    assert indices == [0, 2]
+    assert [source["content"] for source in packed] == [sources[0]["content"], sources[2]["content"]]
+
+
+def test_images_count_against_the_image_and_token_budgets():
+    image = {"image_ref": "0" * 64, "content_type": "image/jpeg"}
+    sources = [image, dict(image), text(5)]
+
+    packed, indices = pack_context(
+        sources, token_budget=IMAGE_PROMPT_TOKENS + 5, max_images=1, min_truncated_tokens=3, model="words"
+    )
+
+    assert indices == [0, 2]
@@ -0,0 +1,39 @@
+from src.vector_store.docstore import SQLiteDocStore
+
+
+def entry(text, filename="0001.pdf"):
+    return {"content": text, "content_type": "text/plain", "metadata": [{"filename": filename, "pagenumber": 1}]}
+
+
+def test_batch_is_invisible_until_committed(tmp_path):
+    store = SQLiteDocStore(str(tmp_path / "docstore.sqlite3"))
+    store.mset([("a", entry("committed"))])
+    version = store.version()
+
+    store.mset([("b", entry("pending")), ("c", entry("pending"))], batch="batch-1")
+
+    # Another connection to the file, as another worker process would have
+    reader = SQLiteDocStore(store.path)
+    assert reader.mget(["a", "b", "c"]) == [entry("committed"), None, None]
+    assert len(reader) == 1
+    assert reader.documents() == {"0001.pdf": 1}
+    assert reader.version() == version
+    # Pending rows are still listed for the document, so a failed ingest can be cleaned up
+    assert sorted(reader.keys_for_document("0001.pdf")) == ["a", "b", "c"]
+
+    assert store.commit_batch("batch-1") == 2
+    assert reader.version() == version + 1
+    assert reader.mget(["b", "c"]) == [entry("pending"), entry("pending")]
+    assert reader.documents() == {"0001.pdf": 3}
+
+
+def test_retracted_entries_are_hidden_until_deleted(tmp_path):
+    store = SQLiteDocStore(str(tmp_path / "docstore.sqlite3"))
+    store.mset([("a", entry("a")), ("b", entry("b"))])
+
+    store.retract(["a"])
+    assert store.mget(["a", "b"]) == [None, entry("b")]
+    assert "a" in store.keys_for_document("0001.pdf")
+
+    store.mdelete(["a"])
+    assert store.keys_for_document("0001.pdf") == ["b"]
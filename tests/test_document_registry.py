@@ -0,0 +1,50 @@
+import threading
+from src.vector_store.document_registry import DocumentRegistry
+
+
+def test_ids_are_allocated_once_and_never_reused(tmp_path):
+    registry = DocumentRegistry(str(tmp_path / "documents.sqlite3"))
+
+    first, created = registry.register("a.pdf", 10, "hash-a")
+    assert (first["id_filename"], created) == ("0001.pdf", True)
+    duplicate, created = registry.register("copy of a.pdf", 10, "hash-a")
+    assert (duplicate["id_filename"], created) == ("0001.pdf", False)
+
+    second, _ = registry.register("b.pdf", 20, "hash-b")
+    registry.delete(second["id_filename"])
+    third, _ = registry.register("c.pdf", 30, "hash-c")
+
+    assert (second["id_filename"], third["id_filename"]) == ("0002.pdf", "0003.pdf")
+
+
+def test_concurrent_uploads_get_distinct_ids(tmp_path):
+    path = str(tmp_path / "documents.sqlite3")
+    DocumentRegistry(path)
+    id_filenames = []
+
+    def upload(worker):
+        # One registry per thread, like separate worker processes sharing the file
+        registry = DocumentRegistry(path)
+        for i in range(10):
+            document, _ = registry.register(f"{worker}-{i}.pdf", i, f"hash-{worker}-{i}")
+            id_filenames.append(document["id_filename"])
+
+    threads = [threading.Thread(target=upload, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(id_filenames) == [f"{i:04d}.pdf" for i in range(1, 41)]
+
+
+def test_imported_mapping_keeps_its_ids(tmp_path):
+    csv_path = tmp_path / "mapping.csv"
+    csv_path.write_text("id_filename,original_filename,file_size\n0007.pdf,old.pdf,5\n")
+    registry = DocumentRegistry(str(tmp_path / "documents.sqlite3"))
+
+    registry.import_mapping_csv(str(csv_path), str(tmp_path))
+    document, _ = registry.register("new.pdf", 1, "hash-new")
+
+    assert registry.get("0007.pdf")["original_filename"] == "old.pdf"
+    assert document["id_filename"] == "0008.pdf"
@@ -0,0 +1,96 @@
+import asyncio
+import random
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+from benchmarks import fake_openai_server
+from src.llm.scheduler import LLMScheduler, INTERACTIVE, BACKGROUND, get_chat_model
+from src.telemetry.metrics import llm_tokens
+from src.telemetry.tracing import current_stage
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """gpt-4o-mini client served in-process by the fake OpenAI server"""
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setitem(fake_openai_server.settings, "latency", 0)
+    monkeypatch.setitem(fake_openai_server.settings, "token_delay", 0)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_openai_server.app))
+    return get_chat_model("gpt-4o-mini", http_async_client=client)
+
+
+def test_streamed_usage_is_counted(fake_model):
+    scheduler = LLMScheduler(rpm=1000, tpm=1_000_000, max_concurrency=1, max_retries=0)
+    labels = {"model": "gpt-4o-mini", "stage": current_stage.get()}
+    before = {kind: llm_tokens.value(kind=kind, **labels) for kind in ("prompt", "completion")}
+
+    async def stream():
+        return [chunk async for chunk in scheduler.astream(fake_model, [HumanMessage(content="hi")], priority=INTERACTIVE)]
+
+    chunks = asyncio.run(stream())
+
+    assert "".join(chunk.content for chunk in chunks).startswith("Fake answer")
+    assert llm_tokens.value(kind="prompt", **labels) - before["prompt"] == 100
+    completion_tokens = llm_tokens.value(kind="completion", **labels) - before["completion"]
+    assert completion_tokens > 0
+    # The reservation made before the call is replaced by the real usage
+    assert scheduler._window[-1][1] == 100 + completion_tokens
+
+
+def test_rate_limited_calls_are_retried(fake_model, monkeypatch):
+    monkeypatch.setitem(fake_openai_server.settings, "rate_limit_ratio", 0.5)
+    random.seed(0)
+    rate_limited = fake_openai_server.counters["rate_limited"]
+    scheduler = LLMScheduler(rpm=1000, tpm=1_000_000, max_concurrency=4, max_retries=20)
+
+    async def calls():
+        return await asyncio.gather(*(scheduler.ainvoke(fake_model, [HumanMessage(content=f"q{i}")]) for i in range(8)))
+
+    messages = asyncio.run(calls())
+
+    assert all(message.content.startswith("Fake answer") for message in messages)
+    assert scheduler.retries > 0
+    assert scheduler.retries == fake_openai_server.counters["rate_limited"] - rate_limited
+
+
+def test_interactive_calls_overtake_queued_background_calls(fake_model, monkeypatch):
+    monkeypatch.setitem(fake_openai_server.settings, "latency", 0.05)
+    scheduler = LLMScheduler(rpm=1000, tpm=1_000_000, max_concurrency=1, max_retries=0)
+    finished = []
+
+    async def call(name, priority):
+        await scheduler.ainvoke(fake_model, [HumanMessage(content=name)], priority=priority)
+        finished.append(name)
+
+    async def calls():
+        tasks = [asyncio.create_task(call("running", BACKGROUND))]
+        await asyncio.sleep(0.01)
+        tasks += [asyncio.create_task(call(f"background-{i}", BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(call("interactive", INTERACTIVE)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(calls())
+
+    assert finished == ["running", "interactive", "background-0", "background-1", "background-2"]
+
+
+def test_calls_wait_for_the_per_minute_budget(fake_model):
+    scheduler = LLMScheduler(rpm=2, tpm=1_000_000, max_concurrency=4, max_retries=0)
+    chats = fake_openai_server.counters["chat"]
+
+    async def calls():
+        for i in range(2):
+            await scheduler.ainvoke(fake_model, [HumanMessage(content=f"q{i}")])
+        assert scheduler._budget_delay(10) > 59
+        # A third call in the same minute is held back rather than sent
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.ainvoke(fake_model, [HumanMessage(content="q2")]), 0.2)
+        assert not scheduler._state().waiting
+
+    asyncio.run(calls())
+
+    assert fake_openai_server.counters["chat"] - chats == 2
+    # Once the oldest call is a minute old, the next one fits again
+    scheduler._window[0][0] -= 60
+    assert scheduler._budget_delay(10) == 0
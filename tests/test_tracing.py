@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+from src.telemetry.metrics import stage_errors
+from src.telemetry.tracing import stage
+
+
+def test_errors_are_counted_but_cancellation_is_not():
+    with pytest.raises(ValueError):
+        with stage("test_failing"):
+            raise ValueError("boom")
+    assert stage_errors.value(stage="test_failing") == 1
+
+    async def cancelled():
+        with stage("test_cancelled"):
+            await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(cancelled())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert stage_errors.value(stage="test_cancelled") == 0
+
+
+def test_a_stream_closed_early_is_not_an_error():
+    def tokens():
+        with stage("test_stream"):
+            yield "a"
+            yield "b"
+
+    stream = tokens()
+    next(stream)
+    stream.close()
+
+    assert stage_errors.value(stage="test_stream") == 0